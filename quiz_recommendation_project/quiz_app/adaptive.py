@@ -0,0 +1,151 @@
+import math
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Avg, Count, F, Q
+
+from .models import Question, QuestionCalibration, UserAnswer
+
+MIN_RESPONSES = 20  # below this a question keeps the default discrimination
+ABILITY_RANGE = 4.0
+
+
+class CalibrationTable:
+    """Difficulty and discrimination of one quiz's questions as parallel arrays"""
+
+    def __init__(self, question_ids, difficulty, discrimination):
+        self.question_ids = question_ids
+        self.difficulty = difficulty
+        self.discrimination = discrimination
+        self.positions = {question_id: i for i, question_id in enumerate(question_ids.tolist())}
+        self.loaded_at = time.monotonic()
+
+    @classmethod
+    def load(cls, quiz_id):
+        # Uncalibrated questions sit at average difficulty with unit discrimination
+        rows = list(
+            Question.objects.filter(quiz_id=quiz_id)
+            .order_by('id')
+            .values_list('id', 'calibration__difficulty', 'calibration__discrimination')
+        )
+        return cls(
+            np.array([r[0] for r in rows], dtype=np.int64),
+            np.array([0.0 if r[1] is None else r[1] for r in rows], dtype=np.float32),
+            np.array([1.0 if r[2] is None else r[2] for r in rows], dtype=np.float32),
+        )
+
+    def probability(self, ability):
+        """Two-parameter logistic chance of a correct answer for every question"""
+        return 1.0 / (1.0 + np.exp(-self.discrimination * (ability - self.difficulty)))
+
+    def update_ability(self, ability, responses):
+        """One Newton step on the ability likelihood for (question_id, is_correct) responses"""
+        positions = [self.positions[q] for q, _ in responses if q in self.positions]
+        if not positions:
+            return ability
+        correct = np.array([c for q, c in responses if q in self.positions], dtype=np.float32)
+        a = self.discrimination[positions]
+        p = self.probability(ability)[positions]
+        information = float(np.sum(a * a * p * (1 - p)))
+        # A unit prior keeps the step finite when all answers agree
+        ability += float(np.sum(a * (correct - p)) - ability) / (information + 1.0)
+        return max(-ABILITY_RANGE, min(ABILITY_RANGE, ability))
+
+    def select(self, ability, count, exclude=()):
+        """Ids of the `count` unseen questions carrying the most information at `ability`"""
+        a = self.discrimination
+        p = self.probability(ability)
+        information = a * a * p * (1 - p)
+        excluded = [self.positions[q] for q in exclude if q in self.positions]
+        information[excluded] = -1.0
+        available = len(information) - len(set(excluded))
+        count = min(count, available)
+        if count <= 0:
+            return []
+        best = np.argpartition(information, -count)[-count:]
+        best = best[np.argsort(information[best])[::-1]]
+        return self.question_ids[best].tolist()
+
+
+_tables = {}
+_tables_lock = threading.Lock()
+
+
+def get_calibration_table(quiz_id):
+    """In-memory calibration table for a quiz, reloaded after ADAPTIVE_TABLE_TTL seconds"""
+    ttl = getattr(settings, 'ADAPTIVE_TABLE_TTL', 300)
+    table = _tables.get(quiz_id)
+    if table is None or time.monotonic() - table.loaded_at > ttl:
+        table = CalibrationTable.load(quiz_id)
+        with _tables_lock:
+            _tables[quiz_id] = table
+    return table
+
+
+def refresh_question_calibration(batch_size=1000):
+    """Recompute every question's calibration from aggregated answers; returns rows written
+
+    Difficulty is the negated smoothed logit of the correct rate. Discrimination
+    comes from the point-biserial correlation between answering correctly and
+    the attempt's overall score, mapped onto the logistic scale. Adaptive
+    attempts are left out: their scores come from different question subsets
+    chosen by ability, so they are not comparable.
+    """
+    stats = (
+        UserAnswer.objects.filter(attempt__completed=True, attempt__adaptive=False)
+        .values('question_id')
+        .annotate(
+            responses=Count('id'),
+            correct=Count('id', filter=Q(is_correct=True)),
+            mean_score=Avg('attempt__score'),
+            mean_square_score=Avg(F('attempt__score') * F('attempt__score')),
+            mean_score_correct=Avg('attempt__score', filter=Q(is_correct=True)),
+            mean_score_wrong=Avg('attempt__score', filter=Q(is_correct=False)),
+        )
+        .order_by('question_id')
+    )
+
+    written = 0
+    batch = []
+    for row in stats.iterator(chunk_size=batch_size):
+        batch.append(calibrate(row))
+        if len(batch) >= batch_size:
+            written += save_calibration(batch)
+            batch = []
+    if batch:
+        written += save_calibration(batch)
+    return written
+
+
+def calibrate(row):
+    responses, correct = row['responses'], row['correct']
+    correct_rate = (correct + 0.5) / (responses + 1)
+    difficulty = -math.log(correct_rate / (1 - correct_rate))
+
+    discrimination = 1.0
+    variance = (row['mean_square_score'] or 0.0) - (row['mean_score'] or 0.0) ** 2
+    if responses >= MIN_RESPONSES and 0 < correct < responses and variance > 0:
+        p = correct / responses
+        r = (row['mean_score_correct'] - row['mean_score_wrong']) / math.sqrt(variance) * math.sqrt(p * (1 - p))
+        r = max(-0.95, min(0.95, r))
+        discrimination = max(0.2, min(3.0, 1.7 * r / math.sqrt(1 - r * r)))
+
+    return QuestionCalibration(
+        question_id=row['question_id'],
+        responses=responses,
+        correct=correct,
+        difficulty=difficulty,
+        discrimination=discrimination,
+    )
+
+
+def save_calibration(rows):
+    QuestionCalibration.objects.bulk_create(
+        rows,
+        update_conflicts=True,
+        unique_fields=['question'],
+        update_fields=['responses', 'correct', 'difficulty', 'discrimination', 'updated_at'],
+    )
+    return len(rows)
@@ -1,6 +1,43 @@
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
 from .models import *
 
+class EstimatedCountPaginator(Paginator):
+    """Paginator that reads the planner's row estimate instead of COUNT(*) on large unfiltered tables
+
+    Only PostgreSQL keeps an estimate (pg_class.reltuples); other backends,
+    including the SQLite default, always count exactly.
+    """
+    exact_count_below = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        query = getattr(queryset, 'query', None)
+        if query is None or query.where:
+            return super().count
+
+        connection = connections[queryset.db]
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT reltuples::bigint FROM pg_class WHERE relname = %s",
+                    [queryset.model._meta.db_table]
+                )
+                row = cursor.fetchone()
+            # reltuples is -1 for tables that were never analyzed
+            if row and row[0] >= self.exact_count_below:
+                return row[0]
+        return super().count
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """Changelist settings for tables that grow with traffic"""
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    ordering = ('-id',)
+
 @admin.register(Subject)
 class SubjectAdmin(admin.ModelAdmin):
     list_display = ('name', 'description')
@@ -13,29 +50,45 @@ class OptionInline(admin.TabularInline):
 class QuestionAdmin(admin.ModelAdmin):
     list_display = ('text', 'quiz')
     list_filter = ('quiz',)
+    list_select_related = ('quiz__subject',)
+    search_fields = ('text',)
     inlines = [OptionInline]
 
 @admin.register(Quiz)
 class QuizAdmin(admin.ModelAdmin):
     list_display = ('title', 'subject', 'created_at')
     list_filter = ('subject',)
+    list_select_related = ('subject',)
+    search_fields = ('title',)
 
 @admin.register(UserQuizAttempt)
-class UserQuizAttemptAdmin(admin.ModelAdmin):
+class UserQuizAttemptAdmin(LargeTableAdmin):
     list_display = ('user', 'quiz', 'score', 'completed', 'started_at', 'completed_at')
+    list_filter = ('completed',)
+    list_select_related = ('user', 'quiz__subject')
+    autocomplete_fields = ('user', 'quiz')
 
 @admin.register(UserAnswer)
-class UserAnswerAdmin(admin.ModelAdmin):
+class UserAnswerAdmin(LargeTableAdmin):
     list_display = ('attempt', 'question', 'selected_option', 'is_correct')
+    list_filter = ('is_correct',)
+    list_select_related = ('attempt__user', 'attempt__quiz__subject', 'question', 'selected_option')
+    raw_id_fields = ('attempt', 'question', 'selected_option')
 
 @admin.register(Resource)
 class ResourceAdmin(admin.ModelAdmin):
     list_display = ('title', 'resource_type', 'url')
+    list_select_related = ('resource_type',)
+    search_fields = ('title',)
     filter_horizontal = ('keywords',)
 
 @admin.register(UserRecommendation)
-class UserRecommendationAdmin(admin.ModelAdmin):
-    list_display = ('user', 'resource', 'relevance_score', 'viewed')
+class UserRecommendationAdmin(LargeTableAdmin):
+    list_display = ('user', 'resource', 'relevance_score', 'viewed', 'engine_version')
+    list_filter = ('viewed',)
+    list_select_related = ('user', 'resource')
+    autocomplete_fields = ('user', 'resource')
+    raw_id_fields = ('quiz_attempt',)
 
 admin.site.register(Keyword)
-admin.site.register(ResourceType)
\ No newline at end of file
+admin.site.register(ResourceType)
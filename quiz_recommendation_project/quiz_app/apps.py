@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class QuizAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'quiz_app'
+
+    def ready(self):
+        # Keep the in-memory recommendation index in sync with content edits
+        from . import signals  # noqa: F401
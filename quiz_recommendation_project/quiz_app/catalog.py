@@ -0,0 +1,269 @@
+"""Streaming import/export of the content catalog
+
+One record per line (JSONL) or row (CSV), each tagged with a `type`:
+
+    {"type": "quiz", "key": "12", "subject": "Maths", "title": "...", "description": "..."}
+    {"type": "question", "quiz": "12", "text": "...", "options": [{"text": "...", "is_correct": true}]}
+    {"type": "resource", "title": "...", "description": "...", "url": "...",
+     "resource_type": "YouTube", "rating": 4.5, "keywords": ["algebra", "matrices"]}
+    {"type": "keyword", "text": "..."}
+
+Questions refer to quizzes by `key`, either one given earlier in the same
+file or the primary key of an existing quiz. In CSV the `options` and
+`keywords` cells hold JSON lists.
+"""
+import csv
+import json
+from itertools import islice
+
+from django.db import transaction
+
+from .models import Keyword, Option, Question, Quiz, Resource, ResourceType, Subject
+
+RECORD_TYPES = ('quiz', 'question', 'resource', 'keyword')
+CSV_FIELDS = (
+    'type', 'key', 'quiz', 'subject', 'title', 'text', 'description',
+    'url', 'resource_type', 'rating', 'options', 'keywords',
+)
+JSON_CELLS = ('options', 'keywords')
+REQUIRED_FIELDS = {
+    'quiz': ('title', 'subject'),
+    'question': ('quiz', 'text'),
+    'resource': ('title', 'url'),
+    'keyword': ('text',),
+}
+TEXT_FIELDS = ('subject', 'title', 'text', 'description', 'url', 'resource_type')
+
+
+def read_records(stream, fmt, errors=None):
+    """Yield record dicts from a JSONL or CSV stream, one at a time
+
+    Lines that do not decode are reported to `errors` with their line
+    number and skipped, so one bad line cannot abort a partly committed import.
+    """
+    errors = [] if errors is None else errors
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            record = {k: v for k, v in row.items() if v not in (None, '')}
+            try:
+                for cell in JSON_CELLS:
+                    if cell in record:
+                        record[cell] = json.loads(record[cell])
+            except ValueError as e:
+                errors.append(f"Line {reader.line_num}: {cell} is not valid JSON ({e})")
+                continue
+            yield record
+    else:
+        for number, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                errors.append(f"Line {number}: not valid JSON ({e})")
+                continue
+            yield record
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class CatalogImporter:
+    """Bulk-creates catalog records chunk by chunk, keeping only small lookup tables in memory"""
+
+    def __init__(self, batch_size=1000):
+        self.batch_size = batch_size
+        self.quiz_keys = {}
+        self.subjects = {}
+        self.resource_types = {}
+        self.counts = {record_type: 0 for record_type in RECORD_TYPES + ('option',)}
+        self.errors = []
+
+    def run(self, records):
+        for chunk in chunked(records, self.batch_size):
+            with transaction.atomic():
+                self.import_chunk(chunk)
+        return self.counts
+
+    def import_chunk(self, chunk):
+        by_type = {record_type: [] for record_type in RECORD_TYPES}
+        for record in chunk:
+            error = self.validate(record)
+            if error:
+                self.errors.append(error)
+            else:
+                by_type[record['type']].append(record)
+        # Quizzes first so questions later in the same chunk can refer to them
+        self.import_quizzes(by_type['quiz'])
+        self.import_questions(by_type['question'])
+        self.import_resources(by_type['resource'])
+        if by_type['keyword']:
+            self.resolve_keywords({r['text'] for r in by_type['keyword']})
+            self.counts['keyword'] += len(by_type['keyword'])
+
+    def validate(self, record):
+        """Problem with a record that would stop it importing, or None"""
+        if not isinstance(record, dict):
+            return f"Record {record!r:.60} is not an object"
+        record_type = record.get('type')
+        if record_type not in REQUIRED_FIELDS:
+            return f"Unknown record type {record_type!r}"
+        missing = [field for field in REQUIRED_FIELDS[record_type] if record.get(field) in (None, '')]
+        if missing:
+            return f"{record_type.capitalize()} record {record!r:.60} is missing {', '.join(missing)}"
+        not_text = [field for field in TEXT_FIELDS if field in record and not isinstance(record[field], str)]
+        if not_text:
+            return f"{record_type.capitalize()} record {record!r:.60} has non-text {', '.join(not_text)}"
+        if record_type == 'resource':
+            try:
+                float(record.get('rating', 0.0))
+            except (TypeError, ValueError):
+                return f"Resource {record['title'][:30]!r} has a non-numeric rating {record['rating']!r}"
+            keywords = record.get('keywords', [])
+            if not isinstance(keywords, list) or not all(isinstance(k, str) for k in keywords):
+                return f"Resource {record['title'][:30]!r} has keywords that are not a list of strings"
+        if record_type == 'question':
+            options = record.get('options', [])
+            if not isinstance(options, list) or any(
+                not isinstance(option, dict) or not option.get('text') or not isinstance(option['text'], str)
+                for option in options
+            ):
+                return f"Question {record['text'][:30]!r} has options that are not a list of objects with text"
+        return None
+
+    def subject_id(self, name):
+        if name not in self.subjects:
+            subject = Subject.objects.filter(name=name).first()
+            if subject is None:
+                subject = Subject.objects.create(name=name, description='')
+            self.subjects[name] = subject.id
+        return self.subjects[name]
+
+    def resource_type_id(self, name):
+        if name not in self.resource_types:
+            self.resource_types[name] = ResourceType.objects.get_or_create(name=name)[0].id
+        return self.resource_types[name]
+
+    def import_quizzes(self, records):
+        quizzes = Quiz.objects.bulk_create([
+            Quiz(
+                title=r['title'],
+                description=r.get('description', ''),
+                subject_id=self.subject_id(r['subject']),
+            )
+            for r in records
+        ], batch_size=self.batch_size)
+        for record, quiz in zip(records, quizzes):
+            self.quiz_keys[str(record.get('key', record['title']))] = quiz.id
+        self.counts['quiz'] += len(quizzes)
+
+    def quiz_id(self, key):
+        key = str(key)
+        if key not in self.quiz_keys and key.isdigit() and Quiz.objects.filter(id=key).exists():
+            self.quiz_keys[key] = int(key)
+        return self.quiz_keys.get(key)
+
+    def import_questions(self, records):
+        resolved = []
+        for record in records:
+            quiz_id = self.quiz_id(record.get('quiz', ''))
+            if quiz_id is None:
+                self.errors.append(f"Question {record.get('text', '')[:30]!r} refers to unknown quiz {record.get('quiz')!r}")
+            else:
+                resolved.append((record, quiz_id))
+
+        questions = Question.objects.bulk_create(
+            [Question(quiz_id=quiz_id, text=record['text']) for record, quiz_id in resolved],
+            batch_size=self.batch_size,
+        )
+        options = Option.objects.bulk_create([
+            Option(question_id=question.id, text=option['text'], is_correct=bool(option.get('is_correct')))
+            for (record, _), question in zip(resolved, questions)
+            for option in record.get('options', ())
+        ], batch_size=self.batch_size)
+        self.counts['question'] += len(questions)
+        self.counts['option'] += len(options)
+
+    def resolve_keywords(self, texts):
+        """Map keyword texts to ids, creating the missing ones with one bulk insert"""
+        texts = {t for t in texts if t}
+        keyword_ids = dict(Keyword.objects.filter(text__in=texts).values_list('text', 'id'))
+        missing = texts - keyword_ids.keys()
+        if missing:
+            Keyword.objects.bulk_create([Keyword(text=t) for t in missing], ignore_conflicts=True)
+            keyword_ids.update(Keyword.objects.filter(text__in=missing).values_list('text', 'id'))
+        return keyword_ids
+
+    def import_resources(self, records):
+        if not records:
+            return
+        keyword_ids = self.resolve_keywords({t for r in records for t in r.get('keywords', ())})
+        resources = Resource.objects.bulk_create([
+            Resource(
+                title=r['title'],
+                description=r.get('description', ''),
+                url=r['url'],
+                resource_type_id=self.resource_type_id(r.get('resource_type', 'Other')),
+                rating=float(r.get('rating', 0.0)),
+            )
+            for r in records
+        ], batch_size=self.batch_size)
+        through = Resource.keywords.through
+        through.objects.bulk_create([
+            through(resource_id=resource.id, keyword_id=keyword_ids[text])
+            for record, resource in zip(records, resources)
+            for text in set(record.get('keywords', ()))
+            if text in keyword_ids
+        ], batch_size=self.batch_size)
+        self.counts['resource'] += len(resources)
+
+
+def export_records(batch_size=1000):
+    """Yield the whole catalog as records, streaming each table with server-side chunks"""
+    quizzes = Quiz.objects.select_related('subject').order_by('id')
+    for quiz in quizzes.iterator(chunk_size=batch_size):
+        yield {
+            'type': 'quiz', 'key': str(quiz.id), 'subject': quiz.subject.name,
+            'title': quiz.title, 'description': quiz.description,
+        }
+
+    questions = Question.objects.prefetch_related('options').order_by('id')
+    for question in questions.iterator(chunk_size=batch_size):
+        yield {
+            'type': 'question', 'quiz': str(question.quiz_id), 'text': question.text,
+            'options': [{'text': o.text, 'is_correct': o.is_correct} for o in question.options.all()],
+        }
+
+    resources = Resource.objects.select_related('resource_type').prefetch_related('keywords').order_by('id')
+    for resource in resources.iterator(chunk_size=batch_size):
+        yield {
+            'type': 'resource', 'title': resource.title, 'description': resource.description,
+            'url': resource.url, 'resource_type': resource.resource_type.name, 'rating': resource.rating,
+            'keywords': [k.text for k in resource.keywords.all()],
+        }
+
+    # Keywords not attached to any resource would otherwise be lost
+    for text in Keyword.objects.filter(resources__isnull=True).values_list('text', flat=True).iterator(chunk_size=batch_size):
+        yield {'type': 'keyword', 'text': text}
+
+
+def write_records(records, stream, fmt):
+    if fmt == 'csv':
+        writer = csv.DictWriter(stream, fieldnames=CSV_FIELDS)
+        writer.writeheader()
+        for record in records:
+            row = dict(record)
+            for cell in JSON_CELLS:
+                if cell in row:
+                    row[cell] = json.dumps(row[cell])
+            writer.writerow(row)
+    else:
+        for record in records:
+            stream.write(json.dumps(record) + '\n')
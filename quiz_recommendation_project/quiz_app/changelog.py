@@ -0,0 +1,50 @@
+"""Reading the IndexChange outbox
+
+Consumers remember the highest change id they have applied (the watermark)
+and scan `id > watermark`. Ids are assigned at insert but become visible at
+commit, so with concurrent writers a transaction holding a lower id can
+commit after a higher one has been consumed; that change is then never
+picked up. The window is as short as the writing transaction, and the
+resource is corrected by its next change or the next `manage.py
+build_index`, which rebuilds from the tables rather than the log. Run
+build_index periodically where content is edited concurrently.
+"""
+from django.db.models import Max
+
+from .models import IndexChange, Resource
+
+
+def latest_change_id():
+    """Id of the newest logged change, used as a snapshot's watermark"""
+    return IndexChange.objects.aggregate(latest=Max('id'))['latest'] or 0
+
+
+def pending_changes(watermark, batch_size=1000):
+    """Yield batches of (id, model, object_id) logged after `watermark`, oldest first"""
+    while True:
+        batch = list(
+            IndexChange.objects.filter(id__gt=watermark)
+            .order_by('id')
+            .values_list('id', 'model', 'object_id')[:batch_size]
+        )
+        if not batch:
+            return
+        yield batch
+        watermark = batch[-1][0]
+
+
+def affected_resource_ids(batch):
+    """Resources whose keyword postings may differ after the changes in `batch`"""
+    resource_ids = {object_id for _, model, object_id in batch if model == 'resource'}
+    keyword_ids = [object_id for _, model, object_id in batch if model == 'keyword']
+    if keyword_ids:
+        through = Resource.keywords.through
+        resource_ids.update(
+            through.objects.filter(keyword_id__in=keyword_ids).values_list('resource_id', flat=True)
+        )
+    return resource_ids
+
+
+def purge_changes(watermark):
+    """Drop log entries already folded into a published snapshot"""
+    return IndexChange.objects.filter(id__lte=watermark).delete()[0]
@@ -0,0 +1,107 @@
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+
+class RequestInProgress(Exception):
+    """A duplicate gave up waiting for the first request of its key to finish"""
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class RequestCoalescer:
+    """Run a computation at most once per key and share its result
+
+    Duplicates arriving while the first call is still running wait for it:
+    threads in the same process block on an event, other processes see the
+    cache lock and poll for the stored result. Finished results stay in the
+    cache for `ttl` seconds and are replayed to later retries. A duplicate
+    that outwaits `lock_timeout` gets RequestInProgress rather than running
+    the computation a second time.
+    """
+
+    def __init__(self, prefix, ttl=None, lock_timeout=None, poll_interval=0.05):
+        self.prefix = prefix
+        self.ttl = ttl
+        self.lock_timeout = lock_timeout
+        self.poll_interval = poll_interval
+        self.lock = threading.Lock()
+        self.inflight = {}
+
+    def get_ttl(self):
+        return self.ttl or getattr(settings, 'REQUEST_REPLAY_TTL', 300)
+
+    def get_lock_timeout(self):
+        return self.lock_timeout or getattr(settings, 'REQUEST_COALESCE_TIMEOUT', 30)
+
+    def run(self, key, compute, should_store=lambda result: True):
+        """Return (result, replayed) for `key`, calling `compute` only if nobody else is"""
+        result_key = f'{self.prefix}:result:{key}'
+        lock_key = f'{self.prefix}:lock:{key}'
+
+        cached = cache.get(result_key)
+        if cached is not None:
+            logger.info(f"Replayed stored result for {self.prefix} {key}")
+            return cached, True
+
+        with self.lock:
+            call = self.inflight.get(key)
+            leader = call is None
+            if leader:
+                call = self.inflight[key] = _Call()
+
+        if not leader:
+            if not call.event.wait(self.get_lock_timeout()):
+                raise RequestInProgress(key)
+            logger.info(f"Coalesced duplicate {self.prefix} request {key}")
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            if cache.add(lock_key, 1, timeout=self.get_lock_timeout()):
+                try:
+                    call.result = compute()
+                    if should_store(call.result):
+                        cache.set(result_key, call.result, timeout=self.get_ttl())
+                finally:
+                    cache.delete(lock_key)
+                return call.result, False
+
+            # Another process holds the lock: wait for its stored result
+            call.result = self.wait_for_result(result_key, lock_key, compute, should_store)
+            return call.result, True
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            call.event.set()
+            with self.lock:
+                del self.inflight[key]
+
+    def wait_for_result(self, result_key, lock_key, compute, should_store):
+        deadline = time.monotonic() + self.get_lock_timeout()
+        while time.monotonic() < deadline:
+            time.sleep(self.poll_interval)
+            cached = cache.get(result_key)
+            if cached is not None:
+                return cached
+            if cache.get(lock_key) is None:
+                # The owner finished without storing a result (e.g. an error response)
+                break
+        else:
+            raise RequestInProgress(result_key)
+        result = compute()
+        if should_store(result):
+            cache.set(result_key, result, timeout=self.get_ttl())
+        return result
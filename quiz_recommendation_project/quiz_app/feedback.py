@@ -0,0 +1,57 @@
+from collections import Counter, defaultdict
+
+from django.db import transaction
+
+from . import profiles, rollups
+from .models import RecommendationInteraction, UserRecommendation
+
+EVENT_CODES = {label: code for code, label in RecommendationInteraction.EVENT_CHOICES}
+# Recommendation flag set by each event; a click also counts as a view
+EVENT_FLAGS = {'view': ('viewed',), 'click': ('viewed', 'clicked'), 'dismiss': ('dismissed',)}
+FLAGS = ('viewed', 'clicked', 'dismissed')
+
+
+def apply_feedback(user, events):
+    """Apply (recommendation_id, event) pairs for `user` in bulk
+
+    Ownership and current flags are read with one query scoped to the
+    user, and every accepted event is appended to the interaction log.
+    Only flags that actually flip feed the profile and resource rollups:
+    each is set with its own UPDATE ... WHERE id = ? AND flag = false and
+    counted by that UPDATE's row count, so a concurrent batch flipping the
+    same row is never counted twice, with or without row locks.
+    Returns the ids that do not belong to the user and were ignored.
+    """
+    requested = {recommendation_id for recommendation_id, _ in events}
+    resource_deltas = defaultdict(Counter)
+    with transaction.atomic():
+        mine = UserRecommendation.objects.filter(user=user)
+        owned = {
+            row[0]: row[1:]
+            for row in mine.filter(id__in=requested).values_list('id', 'resource_id', *FLAGS)
+        }
+
+        candidates = {flag: set() for flag in FLAGS}
+        for recommendation_id, event in events:
+            if recommendation_id in owned:
+                current = dict(zip(FLAGS, owned[recommendation_id][1:]))
+                for flag in EVENT_FLAGS[event]:
+                    if not current[flag]:
+                        candidates[flag].add(recommendation_id)
+
+        updated = dict.fromkeys(FLAGS, 0)
+        for flag, ids in candidates.items():
+            for recommendation_id in sorted(ids):
+                if mine.filter(id=recommendation_id, **{flag: False}).update(**{flag: True}):
+                    updated[flag] += 1
+                    resource_deltas[owned[recommendation_id][0]][flag] += 1
+
+        RecommendationInteraction.objects.bulk_create([
+            RecommendationInteraction(user=user, resource_id=owned[recommendation_id][0], event=EVENT_CODES[event])
+            for recommendation_id, event in events
+            if recommendation_id in owned
+        ])
+        profiles.record_recommendations_viewed(user.id, updated['viewed'])
+        rollups.record_feedback(resource_deltas)
+
+    return sorted(requested - owned.keys())
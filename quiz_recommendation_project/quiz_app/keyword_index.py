@@ -0,0 +1,514 @@
+import logging
+import math
+import threading
+import time
+from collections import Counter, namedtuple
+from datetime import datetime, timedelta, timezone as dt_timezone
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from . import changelog, snapshots
+from .models import Keyword, Resource, ResourceType
+
+logger = logging.getLogger(__name__)
+
+# Same tokenization the TF-IDF based engine applies to keyword and query text
+analyze = TfidfVectorizer(stop_words='english').build_analyzer()
+
+
+class KeywordIndex:
+    """Interned keyword vocabulary with resource -> term postings in CSR form
+
+    The transposed (term -> resource) postings are kept alongside so a query
+    only ever touches resources sharing at least one term with it.
+    """
+
+    ARRAYS = (
+        'terms', 'resource_ids', 'indptr', 'indices', 'counts', 'idf', 'data',
+        'term_indptr', 'postings', 'posting_data', 'term_max',
+        'resource_types', 'ratings', 'created_at',
+    )
+
+    def __init__(self, terms, resource_ids, indptr, indices, counts, idf, data,
+                 term_indptr, postings, posting_data, term_max,
+                 resource_types, ratings, created_at):
+        self.terms = terms                  # term id -> term text
+        self.resource_ids = resource_ids    # row -> Resource.id (int64)
+        self.indptr = indptr                # row offsets into indices/data (int64)
+        self.indices = indices              # term ids (int32)
+        self.counts = counts                # raw term frequencies (float32)
+        self.idf = idf                      # per-term idf weights (float32)
+        self.data = data                    # l2-normalised tf-idf weights (float32)
+        self.term_indptr = term_indptr      # term offsets into postings (int64)
+        self.postings = postings            # rows sorted within each term (int32)
+        self.posting_data = posting_data    # weights aligned with postings (float32)
+        self.term_max = term_max            # largest weight in each posting list (float32)
+        # Filterable attribute columns, aligned with resource_ids
+        self.resource_types = resource_types  # ResourceType.id (int64)
+        self.ratings = ratings              # Resource.rating (float32)
+        self.created_at = created_at        # Resource.created_at as epoch seconds (int64)
+        self.vocabulary = {term: i for i, term in enumerate(terms.tolist())}
+
+    @classmethod
+    def from_postings(cls, terms, resource_ids, indptr, indices, counts, resource_types, ratings, created_at):
+        """Compute tf-idf weights for raw postings and wrap them in an index"""
+        n_resources = len(resource_ids)
+        n_terms = len(terms)
+        df = np.bincount(indices, minlength=n_terms)
+        # Smoothed idf, matching TfidfVectorizer's defaults
+        idf = (np.log((1 + n_resources) / (1 + df)) + 1).astype(np.float32)
+
+        data = counts * idf[indices]
+        rows = np.repeat(np.arange(n_resources, dtype=np.int32), np.diff(indptr))
+        norms = np.sqrt(np.bincount(rows, weights=data * data, minlength=n_resources))
+        data = (data / norms[rows]).astype(np.float32)
+
+        # Transpose to term -> resource postings; a stable sort keeps rows ordered per term
+        order = np.argsort(indices, kind='stable')
+        term_indptr = np.zeros(n_terms + 1, dtype=np.int64)
+        np.cumsum(df, out=term_indptr[1:])
+        postings = rows[order]
+        posting_data = data[order]
+        term_max = np.zeros(n_terms, dtype=np.float32)
+        np.maximum.at(term_max, indices, data)
+
+        return cls(terms, resource_ids, indptr, indices, counts, idf, data,
+                   term_indptr, postings, posting_data, term_max,
+                   resource_types, ratings, created_at)
+
+    def save(self, directory):
+        """Write every array as its own .npy file so it can be memory-mapped"""
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        for name in self.ARRAYS:
+            np.save(directory / f'{name}.npy', getattr(self, name), allow_pickle=False)
+
+    @classmethod
+    def load(cls, directory, mmap_mode='r'):
+        """Open a saved index; with mmap_mode the arrays are backed by the page cache"""
+        directory = Path(directory)
+        arrays = {
+            name: np.load(directory / f'{name}.npy', mmap_mode=mmap_mode, allow_pickle=False)
+            for name in cls.ARRAYS
+        }
+        return cls(**arrays)
+
+    def with_resources(self, updates):
+        """Return a new index with the rows of `updates` replaced
+
+        `updates` maps Resource.id to a ResourceRow, or None for a deleted
+        resource; a row without terms removes the resource too. Unchanged
+        rows are carried over as arrays and unseen terms are appended to the
+        vocabulary.
+        """
+        vocabulary_size = len(self.terms)
+        new_terms = {}
+
+        def intern(term):
+            term_id = self.vocabulary.get(term)
+            if term_id is None:
+                term_id = new_terms.setdefault(term, vocabulary_size + len(new_terms))
+            return term_id
+
+        row_lengths = np.diff(self.indptr)
+        keep = ~np.isin(self.resource_ids, np.fromiter(updates, dtype=np.int64))
+        keep_postings = np.repeat(keep, row_lengths)
+        resource_ids = [self.resource_ids[keep]]
+        lengths = [row_lengths[keep]]
+        indices = [self.indices[keep_postings]]
+        counts = [self.counts[keep_postings]]
+        added = []
+
+        for resource_id, resource in sorted(updates.items()):
+            if resource is None or not resource.term_counts:
+                continue
+            row = sorted((intern(term), count) for term, count in resource.term_counts.items())
+            resource_ids.append(np.array([resource_id], dtype=np.int64))
+            lengths.append(np.array([len(row)], dtype=np.int64))
+            indices.append(np.array([term_id for term_id, _ in row], dtype=np.int32))
+            counts.append(np.array([count for _, count in row], dtype=np.float32))
+            added.append(resource)
+
+        terms = self.terms
+        if new_terms:
+            terms = np.concatenate((terms, np.array(list(new_terms), dtype=str)))
+        indptr = np.zeros(sum(len(l) for l in lengths) + 1, dtype=np.int64)
+        np.cumsum(np.concatenate(lengths), out=indptr[1:])
+
+        return KeywordIndex.from_postings(
+            terms,
+            np.concatenate(resource_ids),
+            indptr,
+            np.concatenate(indices),
+            np.concatenate(counts),
+            np.concatenate((self.resource_types[keep], np.array([r.resource_type for r in added], dtype=np.int64))),
+            np.concatenate((self.ratings[keep], np.array([r.rating for r in added], dtype=np.float32))),
+            np.concatenate((self.created_at[keep], np.array([r.created_at for r in added], dtype=np.int64))),
+        )
+
+    def __len__(self):
+        return len(self.resource_ids)
+
+    def query_vector(self, keywords, term_weights=None):
+        """Map query keywords to (term ids, normalised weights), dropping unknown terms
+
+        Each keyword counts once; `term_weights` adds extra per-term weight,
+        e.g. a user's long-term weak areas, on top of the query keywords.
+        """
+        weighted = {}
+        for keyword in keywords:
+            if keyword in self.vocabulary:
+                weighted[self.vocabulary[keyword]] = 1.0
+        for term, weight in (term_weights or {}).items():
+            if term in self.vocabulary and weight > 0:
+                term_id = self.vocabulary[term]
+                weighted[term_id] = weighted.get(term_id, 0.0) + weight
+
+        term_ids = np.fromiter(sorted(weighted), dtype=np.int32, count=len(weighted))
+        weights = self.idf[term_ids] * np.array([weighted[t] for t in term_ids.tolist()], dtype=np.float32)
+        norm = np.sqrt(np.dot(weights, weights))
+        if norm > 0:
+            weights = weights / norm
+        return term_ids, weights
+
+    def search(self, keywords, limit=5, stats=None, term_weights=None, resource_filter=None):
+        """Return up to `limit` (resource_id, score) pairs with a positive cosine score
+
+        Posting lists are walked term-at-a-time in decreasing order of their
+        score upper bound (max-score). Once the k-th best accumulated score
+        beats everything the remaining lists could add, those lists may only
+        top up existing candidates and hopeless candidates are dropped. If a
+        `stats` dict is passed it receives the posting, candidate and pruning
+        counts for the query.
+
+        A `resource_filter` is checked against the attribute columns of each
+        posting list before it is merged, so filtered-out resources never
+        take a top-k slot and only the touched rows are ever tested.
+        """
+        term_ids, weights = self.query_vector(keywords, term_weights)
+        if stats is not None:
+            stats.update(terms=len(term_ids), postings=0, filtered=0, candidates=0, pruned=0)
+        if not len(self) or not term_ids.size:
+            return []
+
+        bounds = weights * self.term_max[term_ids]
+        order = np.argsort(bounds)[::-1]
+        # remaining[i]: the most any terms after position i can still add
+        remaining = np.concatenate((np.cumsum(bounds[order][::-1])[::-1][1:], [0.0]))
+
+        candidates = np.empty(0, dtype=np.int32)
+        scores = np.empty(0, dtype=np.float32)
+        accepting = True
+        postings_seen = 0
+        filtered = 0
+        pruned = 0
+
+        for position, i in enumerate(order):
+            start, end = self.term_indptr[term_ids[i]], self.term_indptr[term_ids[i] + 1]
+            rows = self.postings[start:end]
+            contribution = self.posting_data[start:end] * weights[i]
+            postings_seen += len(rows)
+            if resource_filter is not None:
+                allowed = resource_filter.allows(self, rows)
+                filtered += int(len(rows) - allowed.sum())
+                rows, contribution = rows[allowed], contribution[allowed]
+
+            if accepting:
+                merged_rows = np.concatenate((candidates, rows))
+                merged_scores = np.concatenate((scores, contribution))
+                candidates, inverse = np.unique(merged_rows, return_inverse=True)
+                scores = np.bincount(inverse, weights=merged_scores).astype(np.float32)
+            elif candidates.size:
+                slots = np.searchsorted(candidates, rows)
+                slots[slots == len(candidates)] = 0
+                hit = candidates[slots] == rows
+                scores[slots[hit]] += contribution[hit]
+                pruned += int(len(rows) - hit.sum())
+            else:
+                pruned += len(rows)
+
+            if len(candidates) >= limit:
+                threshold = np.partition(scores, -limit)[-limit]
+                if threshold >= remaining[position]:
+                    accepting = False
+                keep = scores + remaining[position] >= threshold
+                pruned += int(len(keep) - keep.sum())
+                candidates, scores = candidates[keep], scores[keep]
+
+        if stats is not None:
+            stats.update(postings=postings_seen, filtered=filtered, candidates=len(candidates), pruned=pruned)
+
+        return top_k(self.resource_ids[candidates], scores, limit)
+
+
+def top_k(resource_ids, scores, limit):
+    """Pick the `limit` best positive scores, highest first"""
+    if limit < len(scores):
+        candidates = np.argpartition(scores, -limit)[-limit:]
+    else:
+        candidates = np.arange(len(scores))
+    candidates = candidates[np.argsort(scores[candidates])[::-1]]
+    return [(int(resource_ids[i]), float(scores[i])) for i in candidates if scores[i] > 0]
+
+
+MAX_ID = 2 ** 63 - 1
+
+
+def finite_float(value):
+    """float(value), raising ValueError for nan and infinities as well"""
+    number = float(value)
+    if not math.isfinite(number):
+        raise ValueError(f'{value!r} is not a finite number')
+    return number
+
+
+ResourceRow = namedtuple('ResourceRow', ['term_counts', 'resource_type', 'rating', 'created_at'])
+
+
+class ResourceFilter:
+    """Attribute predicate applied inside retrieval instead of on the ranked list"""
+
+    PARAMS = ('resource_type', 'min_rating', 'max_age_days')
+
+    def __init__(self, resource_types=None, min_rating=None, created_after=None):
+        self.resource_types = list(resource_types) if resource_types else None
+        self.min_rating = min_rating
+        self.created_after = created_after
+
+    @classmethod
+    def from_query_params(cls, params):
+        """Parse resource_type, min_rating and max_age_days; None when no filter is given
+
+        resource_type is a comma-separated list of ResourceType ids or names.
+        Raises ValueError on malformed values.
+        """
+        resource_types = None
+        if params.get('resource_type'):
+            values = [v.strip() for v in params['resource_type'].split(',') if v.strip()]
+            ids = [int(v) for v in values if v.isdigit()]
+            if any(i > MAX_ID for i in ids):
+                raise ValueError('resource_type id out of range')
+            names = [v for v in values if not v.isdigit()]
+            if names:
+                name_filter = Q()
+                for name in names:
+                    name_filter |= Q(name__iexact=name)
+                ids += list(ResourceType.objects.filter(name_filter).values_list('id', flat=True))
+            # An unknown type matches nothing rather than everything
+            resource_types = ids or [0]
+
+        min_rating = finite_float(params['min_rating']) if params.get('min_rating') else None
+        created_after = None
+        if params.get('max_age_days'):
+            max_age_days = finite_float(params['max_age_days'])
+            if max_age_days < 0:
+                raise ValueError('max_age_days must not be negative')
+            try:
+                created_after = timezone.now() - timedelta(days=max_age_days)
+            except OverflowError:
+                # Reaches back before any representable date, i.e. no age limit
+                pass
+
+        if resource_types is None and min_rating is None and created_after is None:
+            return None
+        return cls(resource_types, min_rating, created_after)
+
+    def to_dict(self):
+        """Plain-JSON form, for sending the filter to the scoring service"""
+        return {
+            'resource_types': self.resource_types,
+            'min_rating': self.min_rating,
+            'created_after': self.created_after.timestamp() if self.created_after else None,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        created_after = data.get('created_after')
+        return cls(
+            data.get('resource_types'),
+            data.get('min_rating'),
+            datetime.fromtimestamp(created_after, dt_timezone.utc) if created_after is not None else None,
+        )
+
+    def allows(self, index, rows):
+        """Boolean mask over `rows` of the index"""
+        mask = np.ones(len(rows), dtype=bool)
+        if self.resource_types is not None:
+            mask &= np.isin(index.resource_types[rows], self.resource_types)
+        if self.min_rating is not None:
+            mask &= index.ratings[rows] >= self.min_rating
+        if self.created_after is not None:
+            mask &= index.created_at[rows] >= int(self.created_after.timestamp())
+        return mask
+
+    def as_q(self, prefix=''):
+        """Equivalent ORM filter, for querysets over Resource or related models"""
+        q = Q()
+        if self.resource_types is not None:
+            q &= Q(**{f'{prefix}resource_type_id__in': self.resource_types})
+        if self.min_rating is not None:
+            q &= Q(**{f'{prefix}rating__gte': self.min_rating})
+        if self.created_after is not None:
+            q &= Q(**{f'{prefix}created_at__gte': self.created_after})
+        return q
+
+
+def build_keyword_index():
+    """Load the whole resource/keyword graph in three bulk queries"""
+    vocabulary = {}
+    keyword_terms = {}
+    for keyword_id, text in Keyword.objects.values_list('id', 'text').iterator():
+        keyword_terms[keyword_id] = [vocabulary.setdefault(t, len(vocabulary)) for t in analyze(text)]
+
+    resource_ids = []
+    indptr = [0]
+    indices = []
+    counts = []
+
+    def flush(resource_id, term_counts):
+        if not term_counts:
+            # Resources without any usable keyword can never be recommended
+            return
+        resource_ids.append(resource_id)
+        for term_id in sorted(term_counts):
+            indices.append(term_id)
+            counts.append(term_counts[term_id])
+        indptr.append(len(indices))
+
+    through = Resource.keywords.through
+    pairs = through.objects.order_by('resource_id').values_list('resource_id', 'keyword_id')
+    current, term_counts = None, Counter()
+    for resource_id, keyword_id in pairs.iterator():
+        if resource_id != current:
+            if current is not None:
+                flush(current, term_counts)
+            current, term_counts = resource_id, Counter()
+        term_counts.update(keyword_terms.get(keyword_id, ()))
+    if current is not None:
+        flush(current, term_counts)
+
+    attributes = {
+        resource_id: (resource_type, rating, int(created_at.timestamp()))
+        for resource_id, resource_type, rating, created_at
+        in Resource.objects.values_list('id', 'resource_type_id', 'rating', 'created_at').iterator()
+    }
+    columns = [attributes[resource_id] for resource_id in resource_ids]
+
+    terms = np.array(list(vocabulary), dtype=str) if vocabulary else np.array([], dtype='U1')
+    return KeywordIndex.from_postings(
+        terms,
+        np.array(resource_ids, dtype=np.int64),
+        np.array(indptr, dtype=np.int64),
+        np.array(indices, dtype=np.int32),
+        np.array(counts, dtype=np.float32),
+        np.array([c[0] for c in columns], dtype=np.int64),
+        np.array([c[1] for c in columns], dtype=np.float32),
+        np.array([c[2] for c in columns], dtype=np.int64),
+    )
+
+
+def resource_rows(resource_ids, chunk_size=500):
+    """Fresh ResourceRows for the given resources; deleted resources map to None"""
+    resource_ids = list(resource_ids)
+    rows = dict.fromkeys(resource_ids)
+    through = Resource.keywords.through
+    for start in range(0, len(resource_ids), chunk_size):
+        chunk = resource_ids[start:start + chunk_size]
+        for resource_id, resource_type, rating, created_at in Resource.objects.filter(
+            id__in=chunk
+        ).values_list('id', 'resource_type_id', 'rating', 'created_at'):
+            rows[resource_id] = ResourceRow(Counter(), resource_type, rating, int(created_at.timestamp()))
+        pairs = through.objects.filter(resource_id__in=chunk).values_list('resource_id', 'keyword__text')
+        for resource_id, text in pairs.iterator():
+            if rows[resource_id] is not None:
+                rows[resource_id].term_counts.update(analyze(text))
+    return rows
+
+
+def apply_pending_changes(index, watermark, batch_size=1000):
+    """Fold logged changes after `watermark` into `index`
+
+    Returns the updated index, the new watermark and the number of
+    resources re-indexed. Only the touched resources are re-read from the
+    database; every other row is carried over from the existing arrays.
+    """
+    resource_ids = set()
+    for batch in changelog.pending_changes(watermark, batch_size):
+        resource_ids |= changelog.affected_resource_ids(batch)
+        watermark = batch[-1][0]
+    if resource_ids:
+        index = index.with_resources(resource_rows(resource_ids))
+    return index, watermark, len(resource_ids)
+
+
+class IndexHolder:
+    """Process-wide handle on the current keyword index
+
+    Prefers the published snapshot, memory-mapped so every worker shares the
+    same page-cache copy, and hot-swaps when CURRENT moves to a new version.
+    Changes logged after the index's watermark are applied in memory, so a
+    restarted worker catches up from the change log instead of rebuilding.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.index = None
+        self.version = None
+        self.watermark = 0
+        self.checked_at = 0.0
+
+    def get(self):
+        index = self.index
+        if index is not None and time.monotonic() - self.checked_at < self.check_interval():
+            return index
+        with self.lock:
+            self.refresh()
+            return self.index
+
+    def refresh(self):
+        self.checked_at = time.monotonic()
+        version = snapshots.current_version()
+        if version is not None and version != self.version:
+            try:
+                manifest = snapshots.check_format(snapshots.read_manifest(version))
+                self.index = KeywordIndex.load(snapshots.snapshot_root() / version)
+                self.version = version
+                self.watermark = manifest.get('watermark', 0)
+                logger.info(f"Loaded keyword index snapshot {version} at change {self.watermark}")
+            except (OSError, ValueError) as e:
+                logger.error(f"Error loading keyword index snapshot {version}: {e}")
+        if self.index is None:
+            # Only a snapshot published after this point should replace it
+            self.version = version
+            self.watermark = changelog.latest_change_id()
+            self.index = build_keyword_index()
+
+        self.index, self.watermark, applied = apply_pending_changes(self.index, self.watermark)
+        if applied:
+            logger.info(f"Applied changes for {applied} resources up to change {self.watermark}")
+
+    def notify(self):
+        """Force the next get() to look for new changes and snapshots"""
+        self.checked_at = 0.0
+
+    @staticmethod
+    def check_interval():
+        return getattr(settings, 'RECOMMENDATION_INDEX_CHECK_INTERVAL', 5.0)
+
+
+_holder = IndexHolder()
+
+
+def get_keyword_index():
+    """Return the process-wide keyword index, loading or building it on first use"""
+    return _holder.get()
+
+
+def notify_index_changed():
+    """Called from the change-capture signals so local edits show up on the next request"""
+    _holder.notify()
@@ -0,0 +1,60 @@
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from quiz_app import changelog, snapshots
+from quiz_app.keyword_index import KeywordIndex, apply_pending_changes, build_keyword_index
+
+
+class Command(BaseCommand):
+    help = 'Fold logged content changes into the published index snapshot'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', help='Snapshot directory (defaults to RECOMMENDATION_INDEX_DIR)')
+        parser.add_argument('--keep', type=int, default=3, help='Number of snapshot versions to retain')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Change log rows read per query')
+        parser.add_argument('--purge', action='store_true',
+                            help='Delete change log rows once they are part of a published snapshot')
+        parser.add_argument('--loop', type=float, metavar='SECONDS',
+                            help='Keep consuming, polling the change log at this interval')
+
+    def handle(self, *args, **options):
+        root = Path(options['output'] or snapshots.snapshot_root())
+        version = snapshots.current_version(root)
+        if version is not None:
+            try:
+                manifest = snapshots.check_format(snapshots.read_manifest(version, root))
+                index = KeywordIndex.load(root / version)
+                watermark = manifest.get('watermark', 0)
+            except (OSError, ValueError) as e:
+                self.stderr.write(f"Cannot continue from {version} ({e}), rebuilding")
+                version = None
+        if version is None:
+            # Nothing usable published yet: start from a full build
+            watermark = changelog.latest_change_id()
+            index = build_keyword_index()
+
+        while True:
+            index, new_watermark, applied = apply_pending_changes(index, watermark, options['batch_size'])
+            if applied or version is None:
+                version = snapshots.write_snapshot(
+                    index, root=root, metadata={'watermark': new_watermark}, keep=options['keep']
+                )
+                self.stdout.write(
+                    f"Published {version}: {applied} resources re-indexed, changes up to {new_watermark}"
+                )
+            elif new_watermark != watermark:
+                # The changes did not touch any indexed resource; only record how far we got
+                snapshots.update_manifest(version, root, {'watermark': new_watermark})
+                self.stdout.write(f"No resources changed, {version} now covers changes up to {new_watermark}")
+
+            if new_watermark != watermark:
+                watermark = new_watermark
+                if options['purge']:
+                    purged = changelog.purge_changes(watermark)
+                    self.stdout.write(f"Purged {purged} change log rows")
+
+            if not options['loop']:
+                break
+            time.sleep(options['loop'])
@@ -0,0 +1,57 @@
+import gzip
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+
+from quiz_app.middleware import brotli
+from quiz_app.models import UserRecommendation
+from quiz_app.renderers import ORJSONRenderer, orjson
+from quiz_app.serializers import serialize_recommendations
+
+
+class Command(BaseCommand):
+    help = 'Compare serialization time and payload size of the recommendation response shapes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=500, help='Recommendations per payload')
+        parser.add_argument('--repeat', type=int, default=20, help='Timed runs per variant')
+        parser.add_argument('--fields', default='id,relevance_score,viewed,resource.title,resource.url',
+                            help='Sparse fieldset used by the sparse variants')
+
+    def handle(self, *args, **options):
+        sample = list(
+            UserRecommendation.objects.select_related('resource').prefetch_related('resource__keywords')[:options['count']]
+        )
+        if not sample:
+            raise CommandError('No recommendations in the database to benchmark with')
+        # Repeat real rows to reach the requested size; duplicates are what sideloading removes
+        recommendations = (sample * (options['count'] // len(sample) + 1))[:options['count']]
+        fields = options['fields'].split(',')
+
+        variants = [
+            ('nested, json', None, False, JSONRenderer()),
+            ('nested, orjson', None, False, ORJSONRenderer()),
+            ('sparse, orjson', fields, False, ORJSONRenderer()),
+            ('sideload, orjson', None, True, ORJSONRenderer()),
+            ('sideload sparse, orjson', fields, True, ORJSONRenderer()),
+        ]
+        if orjson is None:
+            self.stderr.write('orjson is not installed; orjson variants use the stdlib encoder')
+
+        self.stdout.write(f"{'variant':<26}{'cpu ms':>10}{'bytes':>10}{'gzip':>10}{'brotli':>10}")
+        for name, variant_fields, sideload, renderer in variants:
+            started = time.process_time()
+            for _ in range(options['repeat']):
+                body = renderer.render(self.payload(recommendations, variant_fields, sideload))
+            cpu_ms = (time.process_time() - started) * 1000 / options['repeat']
+            brotli_size = len(brotli.compress(body, quality=5)) if brotli else '-'
+            self.stdout.write(
+                f"{name:<26}{cpu_ms:>10.2f}{len(body):>10}{len(gzip.compress(body)):>10}{brotli_size:>10}"
+            )
+
+    def payload(self, recommendations, fields, sideload):
+        data, resources = serialize_recommendations(recommendations, fields, sideload)
+        if sideload:
+            return {'recommendations': data, 'resources': resources}
+        return data
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from quiz_app import changelog, snapshots
+from quiz_app.keyword_index import build_keyword_index
+
+
+class Command(BaseCommand):
+    help = 'Build the recommendation index and publish it as a memory-mappable snapshot'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', help='Snapshot directory (defaults to RECOMMENDATION_INDEX_DIR)')
+        parser.add_argument('--keep', type=int, default=3, help='Number of snapshot versions to retain')
+
+    def handle(self, *args, **options):
+        # Taken before reading content: replaying a change the build already saw is harmless
+        watermark = changelog.latest_change_id()
+        index = build_keyword_index()
+        version = snapshots.write_snapshot(
+            index, root=options['output'], metadata={'watermark': watermark}, keep=options['keep']
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Published index {version}: {len(index)} resources, "
+            f"{len(index.terms)} terms, {len(index.indices)} postings"
+        ))
@@ -0,0 +1,24 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from quiz_app.catalog import export_records, write_records
+
+
+class Command(BaseCommand):
+    help = 'Stream quizzes, questions, options, resources and keywords out as JSONL or CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Output file, or '-' for stdout")
+        parser.add_argument('--format', choices=['jsonl', 'csv'], help='Defaults to the file extension')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('csv' if path.endswith('.csv') else 'jsonl')
+        stream = sys.stdout if path == '-' else open(path, 'w', newline='', encoding='utf-8')
+        try:
+            write_records(export_records(options['batch_size']), stream, fmt)
+        finally:
+            if stream is not sys.stdout:
+                stream.close()
@@ -0,0 +1,37 @@
+import sys
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+from quiz_app.catalog import CatalogImporter, read_records
+
+
+class Command(BaseCommand):
+    help = 'Bulk import quizzes, questions, options, resources and keywords from JSONL or CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Input file, or '-' for stdin")
+        parser.add_argument('--format', choices=['jsonl', 'csv'], help='Defaults to the file extension')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--skip-index', action='store_true', help='Do not rebuild the recommendation index')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('csv' if path.endswith('.csv') else 'jsonl')
+        stream = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+        importer = CatalogImporter(batch_size=options['batch_size'])
+        try:
+            counts = importer.run(read_records(stream, fmt, importer.errors))
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        for error in importer.errors:
+            self.stderr.write(error)
+        self.stdout.write(self.style.SUCCESS(
+            'Imported ' + ', '.join(f'{record_type}: {count}' for record_type, count in counts.items())
+        ))
+
+        # bulk_create bypasses the change-capture signals, so rebuild once for the whole import
+        if not options['skip_index'] and counts['resource'] + counts['keyword']:
+            call_command('build_index', stdout=self.stdout)
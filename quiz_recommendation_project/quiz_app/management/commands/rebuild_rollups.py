@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from quiz_app.models import QuestionStat, QuizDailyStat, ResourceStat
+from quiz_app.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Recompute the analytics rollup tables from raw attempts, answers and recommendations'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        rebuild_rollups(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {QuizDailyStat.objects.count()} quiz-day, {QuestionStat.objects.count()} question "
+            f"and {ResourceStat.objects.count()} resource rollups"
+        ))
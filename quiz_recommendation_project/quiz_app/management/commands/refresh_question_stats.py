@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from quiz_app.adaptive import refresh_question_calibration
+
+
+class Command(BaseCommand):
+    help = 'Recompute question difficulty and discrimination from aggregated answers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        written = refresh_question_calibration(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Calibrated {written} questions"))
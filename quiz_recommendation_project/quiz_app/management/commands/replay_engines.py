@@ -0,0 +1,117 @@
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+from django.utils import timezone
+
+from quiz_app.keyword_index import analyze, get_keyword_index
+from quiz_app.models import UserAnswer, UserQuizAttempt, UserRecommendation
+from quiz_app.recommendation import ENGINES, get_engine
+
+
+class Command(BaseCommand):
+    help = (
+        'Re-rank historical quiz attempts with registered engines and score them against '
+        'what users actually viewed and the questions they got wrong'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--engines', default=','.join(sorted(ENGINES)),
+                            help='Comma-separated engine versions to compare')
+        parser.add_argument('--limit', type=int, default=500, help='Most recent graded attempts to replay')
+        parser.add_argument('--days', type=int, help='Only replay attempts completed in the last N days')
+        parser.add_argument('--k', type=int, default=5, help='Cut-off for precision@k')
+
+    def handle(self, *args, **options):
+        versions = [v.strip() for v in options['engines'].split(',') if v.strip()]
+        try:
+            engines = [get_engine(version) for version in versions]
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        attempts = UserQuizAttempt.objects.filter(completed=True, answers__is_correct=False)
+        if options['days']:
+            attempts = attempts.filter(completed_at__gte=timezone.now() - timedelta(days=options['days']))
+        attempts = list(attempts.distinct().order_by('-id').values_list('id', 'user_id')[:options['limit']])
+        if not attempts:
+            raise CommandError('No graded attempts with wrong answers to replay')
+
+        attempt_ids = [attempt_id for attempt_id, _ in attempts]
+        viewed, dismissed = self.feedback(attempt_ids)
+        wrong_terms = self.wrong_answer_terms(attempt_ids)
+        resource_terms = self.resource_terms()
+
+        self.stdout.write(
+            f"Replaying {len(attempts)} attempts ({sum(1 for a in attempt_ids if viewed[a])} with views). "
+            "Profiles and collaborative signals are read as they are now, not as of each attempt."
+        )
+        precision_label = f"p@{options['k']}"
+        self.stdout.write(
+            f"{'engine':<16}{'ms/rank':>10}{'results':>10}{precision_label:>10}"
+            f"{'recall':>10}{'dismissed':>11}{'coverage':>10}"
+        )
+        for engine in engines:
+            self.report(engine, attempts, viewed, dismissed, wrong_terms, resource_terms, options['k'])
+
+    def report(self, engine, attempts, viewed, dismissed, wrong_terms, resource_terms, k):
+        elapsed = 0.0
+        results = precision = recall = dismissal = coverage = 0.0
+        with_views = ranked = 0
+        for attempt_id, user_id in attempts:
+            started = time.perf_counter()
+            ranking, _, _ = engine.rank(user_id, attempt_id)
+            elapsed += time.perf_counter() - started
+            resource_ids = [resource_id for resource_id, _ in ranking]
+            results += len(resource_ids)
+
+            if viewed[attempt_id]:
+                with_views += 1
+                precision += len(set(resource_ids[:k]) & viewed[attempt_id]) / k
+                recall += len(set(resource_ids) & viewed[attempt_id]) / len(viewed[attempt_id])
+            if resource_ids:
+                ranked += 1
+                dismissal += len(set(resource_ids) & dismissed[attempt_id]) / len(resource_ids)
+
+            # Share of wrongly answered questions sharing a term with some recommended resource
+            covered_terms = set().union(*(resource_terms.get(r, ()) for r in resource_ids))
+            questions = wrong_terms[attempt_id]
+            coverage += sum(1 for terms in questions if terms & covered_terms) / len(questions) if questions else 0.0
+
+        n = len(attempts)
+        self.stdout.write(
+            f"{engine.version:<16}{elapsed * 1000 / n:>10.2f}{results / n:>10.2f}"
+            f"{precision / max(with_views, 1):>10.3f}{recall / max(with_views, 1):>10.3f}"
+            f"{dismissal / max(ranked, 1):>11.3f}{coverage / n:>10.3f}"
+        )
+
+    def feedback(self, attempt_ids):
+        viewed, dismissed = defaultdict(set), defaultdict(set)
+        rows = UserRecommendation.objects.filter(quiz_attempt_id__in=attempt_ids).filter(
+            Q(viewed=True) | Q(dismissed=True)
+        )
+        for attempt_id, resource_id, was_viewed, was_dismissed in rows.values_list(
+            'quiz_attempt_id', 'resource_id', 'viewed', 'dismissed'
+        ).iterator():
+            if was_viewed:
+                viewed[attempt_id].add(resource_id)
+            if was_dismissed:
+                dismissed[attempt_id].add(resource_id)
+        return viewed, dismissed
+
+    def wrong_answer_terms(self, attempt_ids):
+        wrong_terms = defaultdict(list)
+        answers = UserAnswer.objects.filter(attempt_id__in=attempt_ids, is_correct=False)
+        for attempt_id, text in answers.values_list('attempt_id', 'question__text').iterator():
+            wrong_terms[attempt_id].append(set(analyze(text)))
+        return wrong_terms
+
+    def resource_terms(self):
+        """Resource id -> analyzed keyword terms, read from the keyword index rows"""
+        index = get_keyword_index()
+        terms = index.terms.tolist()
+        return {
+            resource_id: {terms[t] for t in index.indices[index.indptr[row]:index.indptr[row + 1]]}
+            for row, resource_id in enumerate(index.resource_ids.tolist())
+        }
@@ -0,0 +1,33 @@
+import ipaddress
+import socket
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from quiz_app.scoring import ScoringServer, parse_address
+
+
+class Command(BaseCommand):
+    help = 'Serve batched recommendation ranking from a pool of pre-forked worker processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--address', default=getattr(settings, 'RECOMMENDATION_SERVICE_ADDRESS', None),
+                            help="'unix:/path/to.sock' or 'host:port' (defaults to RECOMMENDATION_SERVICE_ADDRESS)")
+        parser.add_argument('--workers', type=int, default=getattr(settings, 'RECOMMENDATION_SERVICE_WORKERS', 4))
+
+    def handle(self, *args, **options):
+        address = options['address']
+        if not address:
+            raise CommandError('No address given and RECOMMENDATION_SERVICE_ADDRESS is not set')
+        family, target = parse_address(address)
+        if family == socket.AF_INET:
+            # The protocol has no authentication, so never listen beyond this machine
+            try:
+                loopback = target[0] == 'localhost' or ipaddress.ip_address(target[0]).is_loopback
+            except ValueError:
+                loopback = False
+            if not loopback:
+                raise CommandError(f'Refusing to listen on non-loopback address {target[0]}')
+
+        self.stdout.write(f"Scoring service listening on {address} with {options['workers']} workers")
+        ScoringServer(address, workers=options['workers']).serve_forever()
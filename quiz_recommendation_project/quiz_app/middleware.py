@@ -0,0 +1,49 @@
+import re
+
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:  # optional dependency, GZipMiddleware still compresses
+    brotli = None
+
+re_accepts_brotli = re.compile(r'\bbr\b')
+
+
+class BrotliMiddleware:
+    """Brotli-compress JSON API responses for clients that accept it
+
+    Listed after GZipMiddleware so it sees the response first; GZip then
+    leaves the already-encoded response alone and handles everyone else.
+    HTML (admin, browsable API) carries CSRF tokens, so it is left to
+    GZipMiddleware and its BREACH padding.
+    """
+    min_length = 200
+    content_types = ('application/json',)
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if brotli is None or response.streaming or len(response.content) < self.min_length:
+            return response
+        if response.has_header('Content-Encoding'):
+            return response
+        if response.get('Content-Type', '').split(';')[0].strip() not in self.content_types:
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if not re_accepts_brotli.search(request.META.get('HTTP_ACCEPT_ENCODING', '')):
+            return response
+
+        compressed = brotli.compress(response.content, quality=5)
+        if len(compressed) >= len(response.content):
+            return response
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = 'br'
+        return response
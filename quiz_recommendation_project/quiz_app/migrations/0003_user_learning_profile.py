@@ -0,0 +1,30 @@
+# Generated by Django 4.2.30 on 2026-10-19 12:28
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('quiz_app', '0002_index_change'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserLearningProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('weak_keywords', models.JSONField(default=dict)),
+                ('weak_subjects', models.JSONField(default=dict)),
+                ('attempts_graded', models.IntegerField(default=0)),
+                ('recommendations_viewed', models.IntegerField(default=0)),
+                ('recommendations_unviewed', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='learning_profile', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.30 on 2026-10-19 12:29
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('quiz_app', '0003_user_learning_profile'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userrecommendation',
+            name='clicked',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='userrecommendation',
+            name='dismissed',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name='RecommendationInteraction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event', models.PositiveSmallIntegerField(choices=[(1, 'view'), (2, 'click'), (3, 'dismiss')])),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('resource', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='quiz_app.resource')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recommendation_interactions', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-19 12:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz_app', '0004_recommendation_feedback'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='useranswer',
+            index=models.Index(fields=['attempt', 'is_correct'], name='quiz_app_us_attempt_525ae2_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='useranswer',
+            index=models.Index(fields=['is_correct', '-id'], name='quiz_app_us_is_corr_134150_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userquizattempt',
+            index=models.Index(fields=['completed', '-id'], name='quiz_app_us_complet_da97d8_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userrecommendation',
+            index=models.Index(fields=['user', '-created_at'], name='quiz_app_us_user_id_4ae8d7_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userrecommendation',
+            index=models.Index(fields=['viewed', '-id'], name='quiz_app_us_viewed_93caa3_idx'),
+        ),
+    ]
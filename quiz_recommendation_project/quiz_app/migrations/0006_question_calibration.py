@@ -0,0 +1,30 @@
+# Generated by Django 4.2.30 on 2026-10-19 12:32
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz_app', '0005_admin_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuestionCalibration',
+            fields=[
+                ('question', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='calibration', serialize=False, to='quiz_app.question')),
+                ('responses', models.IntegerField(default=0)),
+                ('correct', models.IntegerField(default=0)),
+                ('difficulty', models.FloatField(default=0.0)),
+                ('discrimination', models.FloatField(default=1.0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='userlearningprofile',
+            name='subject_ability',
+            field=models.JSONField(default=dict),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 4.2.30 on 2026-10-19 12:34
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz_app', '0006_question_calibration'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuestionStat',
+            fields=[
+                ('question', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stat', serialize=False, to='quiz_app.question')),
+                ('answered', models.IntegerField(default=0)),
+                ('correct', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ResourceStat',
+            fields=[
+                ('resource', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stat', serialize=False, to='quiz_app.resource')),
+                ('recommended', models.IntegerField(default=0)),
+                ('viewed', models.IntegerField(default=0)),
+                ('clicked', models.IntegerField(default=0)),
+                ('dismissed', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='QuizDailyStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('attempts', models.IntegerField(default=0)),
+                ('passes', models.IntegerField(default=0)),
+                ('total_score', models.FloatField(default=0.0)),
+                ('quiz', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='quiz_app.quiz')),
+            ],
+            options={
+                'unique_together': {('quiz', 'date')},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-19 12:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz_app', '0007_analytics_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userrecommendation',
+            name='engine_version',
+            field=models.CharField(blank=True, default='', max_length=32),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-19 12:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz_app', '0008_recommendation_engine_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userquizattempt',
+            name='adaptive',
+            field=models.BooleanField(default=False),
+        ),
+    ]
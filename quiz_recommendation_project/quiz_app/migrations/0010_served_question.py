@@ -0,0 +1,25 @@
+# Generated by Django 4.2.30 on 2026-10-19 13:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz_app', '0009_attempt_adaptive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ServedQuestion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('attempt', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='served_questions', to='quiz_app.userquizattempt')),
+                ('question', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='quiz_app.question')),
+            ],
+            options={
+                'unique_together': {('attempt', 'question')},
+            },
+        ),
+    ]
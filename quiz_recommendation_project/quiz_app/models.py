@@ -1,6 +1,7 @@
 # Create your models here.
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
 
 class Subject(models.Model):
     name = models.CharField(max_length=100)
@@ -42,9 +43,14 @@ class UserQuizAttempt(models.Model):
     completed = models.BooleanField(default=False)
     started_at = models.DateTimeField(auto_now_add=True)
     completed_at = models.DateTimeField(null=True, blank=True)
+    adaptive = models.BooleanField(default=False)  # served a calibrated subset; scored on its served questions
     
     class Meta:
         unique_together = ('user', 'quiz')
+        indexes = [
+            # Admin changelist filter, newest first
+            models.Index(fields=['completed', '-id']),
+        ]
     
     def __str__(self):
         return f"{self.user.username} - {self.quiz.title}"
@@ -55,9 +61,28 @@ class UserAnswer(models.Model):
     selected_option = models.ForeignKey(Option, on_delete=models.CASCADE)
     is_correct = models.BooleanField(default=False)
     
+    class Meta:
+        indexes = [
+            # Wrong answers of an attempt, read by the recommendation engine
+            models.Index(fields=['attempt', 'is_correct']),
+            # Admin changelist filter, newest first
+            models.Index(fields=['is_correct', '-id']),
+        ]
+    
     def __str__(self):
         return f"{self.attempt.user.username} - {self.question.text[:30]}"
 
+class ServedQuestion(models.Model):
+    """A question shown on an adaptive attempt; the attempt is scored against these"""
+    attempt = models.ForeignKey(UserQuizAttempt, on_delete=models.CASCADE, related_name='served_questions')
+    question = models.ForeignKey(Question, on_delete=models.CASCADE)
+    
+    class Meta:
+        unique_together = ('attempt', 'question')
+    
+    def __str__(self):
+        return f"{self.attempt_id} - {self.question_id}"
+
 class Keyword(models.Model):
     text = models.CharField(max_length=100, unique=True)
     
@@ -89,9 +114,107 @@ class UserRecommendation(models.Model):
     relevance_score = models.FloatField(default=0.0)
     created_at = models.DateTimeField(auto_now_add=True)
     viewed = models.BooleanField(default=False)
+    clicked = models.BooleanField(default=False)
+    dismissed = models.BooleanField(default=False)
+    engine_version = models.CharField(max_length=32, blank=True, default='')  # registry tag of the engine that ranked it
     
     class Meta:
         unique_together = ('user', 'resource', 'quiz_attempt')
+        indexes = [
+            # Latest recommendations for a user
+            models.Index(fields=['user', '-created_at']),
+            # Admin changelist filter, newest first
+            models.Index(fields=['viewed', '-id']),
+        ]
     
     def __str__(self):
-        return f"{self.user.username} - {self.resource.title}"
\ No newline at end of file
+        return f"{self.user.username} - {self.resource.title}"
+
+class QuestionCalibration(models.Model):
+    """Per-question difficulty and discrimination, refreshed in batch from UserAnswer statistics"""
+    question = models.OneToOneField(Question, on_delete=models.CASCADE, primary_key=True, related_name='calibration')
+    responses = models.IntegerField(default=0)
+    correct = models.IntegerField(default=0)
+    difficulty = models.FloatField(default=0.0)  # logit scale, 0 = answered correctly half the time
+    discrimination = models.FloatField(default=1.0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.question} (b={self.difficulty:.2f}, a={self.discrimination:.2f})"
+
+class UserLearningProfile(models.Model):
+    """Per-user aggregate of weak areas, updated incrementally instead of re-read from history"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='learning_profile')
+    weak_keywords = models.JSONField(default=dict)  # term -> weight, decayed as of updated_at
+    weak_subjects = models.JSONField(default=dict)  # subject id -> weight, decayed as of updated_at
+    subject_ability = models.JSONField(default=dict)  # subject id -> ability estimate on the logit scale
+    attempts_graded = models.IntegerField(default=0)
+    recommendations_viewed = models.IntegerField(default=0)
+    recommendations_unviewed = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.user.username} profile"
+
+class RecommendationInteraction(models.Model):
+    """Append-only log of recommendation feedback, the training input for collaborative models"""
+    VIEW = 1
+    CLICK = 2
+    DISMISS = 3
+    EVENT_CHOICES = [(VIEW, 'view'), (CLICK, 'click'), (DISMISS, 'dismiss')]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='recommendation_interactions')
+    resource = models.ForeignKey(Resource, on_delete=models.CASCADE)
+    event = models.PositiveSmallIntegerField(choices=EVENT_CHOICES)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.user_id} {self.get_event_display()} {self.resource_id}"
+
+class QuizDailyStat(models.Model):
+    """Rollup of graded attempts per quiz and day"""
+    quiz = models.ForeignKey(Quiz, on_delete=models.CASCADE, related_name='daily_stats')
+    date = models.DateField()
+    attempts = models.IntegerField(default=0)
+    passes = models.IntegerField(default=0)
+    total_score = models.FloatField(default=0.0)
+
+    class Meta:
+        unique_together = ('quiz', 'date')
+
+    def __str__(self):
+        return f"{self.quiz} {self.date}"
+
+class QuestionStat(models.Model):
+    """Running answer counts per question"""
+    question = models.OneToOneField(Question, on_delete=models.CASCADE, primary_key=True, related_name='stat')
+    answered = models.IntegerField(default=0)
+    correct = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.question} {self.correct}/{self.answered}"
+
+class ResourceStat(models.Model):
+    """Running recommendation and feedback counts per resource"""
+    resource = models.OneToOneField(Resource, on_delete=models.CASCADE, primary_key=True, related_name='stat')
+    recommended = models.IntegerField(default=0)
+    viewed = models.IntegerField(default=0)
+    clicked = models.IntegerField(default=0)
+    dismissed = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.resource} {self.viewed}/{self.recommended}"
+
+class IndexChange(models.Model):
+    """Outbox of content changes, consumed in id order by the recommendation indexes"""
+    SAVE = 'save'
+    DELETE = 'delete'
+    ACTION_CHOICES = [(SAVE, 'Save'), (DELETE, 'Delete')]
+
+    model = models.CharField(max_length=50)
+    object_id = models.BigIntegerField()
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.id}: {self.action} {self.model} {self.object_id}"
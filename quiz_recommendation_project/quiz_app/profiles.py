@@ -0,0 +1,93 @@
+import math
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import UserLearningProfile
+
+
+def half_life_days():
+    return getattr(settings, 'LEARNING_PROFILE_HALF_LIFE_DAYS', 30)
+
+
+def max_keywords():
+    return getattr(settings, 'LEARNING_PROFILE_MAX_KEYWORDS', 50)
+
+
+def ability_update_weight():
+    return getattr(settings, 'LEARNING_PROFILE_ABILITY_WEIGHT', 0.3)
+
+
+def decay_factor(since, now=None):
+    """Exponential decay applied to weights last written at `since`"""
+    elapsed_days = ((now or timezone.now()) - since).total_seconds() / 86400
+    return 0.5 ** (max(elapsed_days, 0) / half_life_days())
+
+
+def decayed(weights, factor, limit=None):
+    """Scale a sparse weight dict, keeping only the `limit` heaviest entries"""
+    items = sorted(((k, w * factor) for k, w in weights.items()), key=lambda kv: kv[1], reverse=True)
+    return dict(items[:limit] if limit else items)
+
+
+def get_weak_keywords(user_id):
+    """Current decayed weak-keyword weights for a user, read from one row"""
+    profile = UserLearningProfile.objects.filter(user_id=user_id).only('weak_keywords', 'updated_at').first()
+    if profile is None:
+        return {}
+    return decayed(profile.weak_keywords, decay_factor(profile.updated_at))
+
+
+def get_subject_ability(user_id, subject_id):
+    """Ability estimate for one subject, 0.0 (average) when nothing is known yet"""
+    profile = UserLearningProfile.objects.filter(user_id=user_id).only('subject_ability').first()
+    if profile is None:
+        return 0.0
+    return profile.subject_ability.get(str(subject_id), 0.0)
+
+
+def record_graded_attempt(user_id, attempt, keywords, wrong_answers, total_answers, recommended):
+    """Fold one graded attempt into the user's profile
+
+    `keywords` are the attempt's weak terms, most important first; earlier
+    ones get a larger share of the update.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        profile, _ = UserLearningProfile.objects.select_for_update().get_or_create(user_id=user_id)
+        factor = decay_factor(profile.updated_at, now)
+
+        weak_keywords = decayed(profile.weak_keywords, factor)
+        for rank, keyword in enumerate(keywords):
+            weak_keywords[keyword] = weak_keywords.get(keyword, 0.0) + 1.0 / (rank + 1)
+        profile.weak_keywords = decayed(weak_keywords, 1.0, max_keywords())
+
+        weak_subjects = decayed(profile.weak_subjects, factor)
+        if total_answers:
+            subject = str(attempt.quiz.subject_id)
+            weak_subjects[subject] = weak_subjects.get(subject, 0.0) + wrong_answers / total_answers
+        profile.weak_subjects = weak_subjects
+
+        if total_answers:
+            # Smoothed logit of the score, blended into the running estimate
+            correct_ratio = (total_answers - wrong_answers + 0.5) / (total_answers + 1)
+            ability = math.log(correct_ratio / (1 - correct_ratio))
+            previous = profile.subject_ability.get(subject)
+            weight = ability_update_weight()
+            profile.subject_ability[subject] = ability if previous is None else (1 - weight) * previous + weight * ability
+
+        profile.attempts_graded += 1
+        profile.recommendations_unviewed += recommended
+        profile.updated_at = now
+        profile.save()
+
+
+def record_recommendations_viewed(user_id, count=1):
+    """Move `count` recommendations from unviewed to viewed in a single UPDATE"""
+    if count:
+        UserLearningProfile.objects.filter(user_id=user_id).update(
+            recommendations_viewed=F('recommendations_viewed') + count,
+            recommendations_unviewed=F('recommendations_unviewed') - count,
+        )
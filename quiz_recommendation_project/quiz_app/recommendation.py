@@ -1,15 +1,42 @@
 import numpy as np
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
 from gensim.models import Word2Vec
 from .models import *
+from .keyword_index import get_keyword_index
+from . import profiles
+from django.conf import settings
 import logging
+import time
 
 logger = logging.getLogger(__name__)
 
+ENGINES = {}
+
+def register_engine(cls):
+    """Class decorator adding an engine to the registry under its `version` tag"""
+    if cls.version in ENGINES:
+        raise ValueError(f"Engine version {cls.version!r} is already registered")
+    ENGINES[cls.version] = cls
+    return cls
+
+def get_engine(version=None):
+    """New instance of a registered engine, RECOMMENDATION_ENGINE by default"""
+    version = version or getattr(settings, 'RECOMMENDATION_ENGINE', RecommendationEngine.version)
+    try:
+        return ENGINES[version]()
+    except KeyError:
+        raise ValueError(f"Unknown recommendation engine {version!r}; registered: {', '.join(sorted(ENGINES))}")
+
+@register_engine
 class RecommendationEngine:
+    # Stored on every UserRecommendation; bump it whenever the ranking changes
+    version = 'tfidf-cf-1'
+
     def __init__(self):
         self.tfidf_vectorizer = TfidfVectorizer(stop_words='english')
+        self.last_query_stats = {}
+        self.last_rank_ms = 0.0
+        self.last_term_weights = {}
         # Word2Vec model would ideally be trained on your corpus
         # For simplicity, we'll use a placeholder method
         
@@ -37,53 +64,29 @@ class RecommendationEngine:
             logger.error(f"Error extracting keywords: {e}")
             return []
     
-    def content_based_recommendation(self, keywords, limit=5):
-        """Generate content-based recommendations using keywords"""
+    def content_based_recommendation(self, keywords, limit=5, term_weights=None, resource_filter=None):
+        """Generate content-based recommendations using keywords, optionally boosted per term and filtered"""
         if not keywords:
             return []
         
-        # Get all resources
-        all_resources = Resource.objects.all()
-        if not all_resources.exists():
-            return []
-        
-        # Create a list of resources with their keyword texts
-        resource_keyword_texts = []
-        resource_ids = []
-        
-        for resource in all_resources:
-            keyword_text = " ".join([k.text for k in resource.keywords.all()])
-            if keyword_text:  # Only include resources with keywords
-                resource_keyword_texts.append(keyword_text)
-                resource_ids.append(resource.id)
-        
-        if not resource_keyword_texts:
-            return []
-        
         try:
-            # Query text is the combined keywords
-            query_text = " ".join(keywords)
-            
-            # Vectorize resource keywords and query
-            all_texts = resource_keyword_texts + [query_text]
-            tfidf_matrix = self.tfidf_vectorizer.fit_transform(all_texts)
-            
-            # Calculate similarity between query and resources
-            query_vector = tfidf_matrix[-1]
-            resource_vectors = tfidf_matrix[:-1]
-            
-            similarities = cosine_similarity(query_vector, resource_vectors).flatten()
-            
-            # Get top matching resources
-            top_indices = similarities.argsort()[::-1][:limit]
-            recommended_resource_ids = [resource_ids[i] for i in top_indices if similarities[i] > 0]
-            
-            return recommended_resource_ids
+            # Score straight from the interned keyword postings, no per-request vectorizing
+            index = get_keyword_index()
+            stats = {}
+            results = index.search(
+                keywords, limit, stats=stats, term_weights=term_weights, resource_filter=resource_filter
+            )
+            self.last_query_stats = stats
+            logger.info(
+                "Keyword index query: %(terms)d terms, %(postings)d postings, %(filtered)d filtered, "
+                "%(candidates)d candidates scored, %(pruned)d pruned", stats
+            )
+            return [resource_id for resource_id, _ in results]
         except Exception as e:
             logger.error(f"Error in content-based recommendation: {e}")
             return []
     
-    def collaborative_filtering(self, user_id, wrong_question_ids, limit=5):
+    def collaborative_filtering(self, user_id, wrong_question_ids, limit=5, resource_filter=None):
         """Simple collaborative filtering based on similar question patterns"""
         if not wrong_question_ids:
             return []
@@ -102,65 +105,137 @@ class RecommendationEngine:
             recommended_resources = Resource.objects.filter(
                 userrecommendation__user__in=similar_users,
                 userrecommendation__relevance_score__gt=0.5
-            ).order_by('-userrecommendation__relevance_score').distinct()[:limit]
+            )
+            if resource_filter is not None:
+                recommended_resources = recommended_resources.filter(resource_filter.as_q())
+            recommended_resources = recommended_resources.order_by('-userrecommendation__relevance_score').distinct()[:limit]
             
             return [r.id for r in recommended_resources]
         except Exception as e:
             logger.error(f"Error in collaborative filtering: {e}")
             return []
     
-    def generate_recommendations(self, user_id, quiz_attempt_id):
-        """Main method to generate and save recommendations"""
+    def rank(self, user_id, quiz_attempt_id, resource_filter=None, term_weights=None):
+        """Rank resources for an attempt without saving anything
+
+        `term_weights` are the profile weights to rank with; when None they
+        are read from the user's profile as it is now. Returns (ranking,
+        keywords, wrong_answers) where ranking is a list of (resource_id,
+        relevance_score), best first.
+        """
+        # Get wrong answers
+        wrong_question_ids = list(UserAnswer.objects.filter(
+            attempt_id=quiz_attempt_id,
+            is_correct=False
+        ).values_list('question_id', flat=True))
+        
+        if not wrong_question_ids:
+            return [], [], 0
+        
+        # Extract keywords from wrong questions
+        keywords = self.extract_keywords_from_questions(wrong_question_ids)
+
+        logger.debug(f"Keywords {keywords}")
+        
+        # Get content-based recommendations, nudged towards long-standing weak areas
+        if term_weights is None:
+            term_weights = self.profile_term_weights(user_id)
+        content_based_ids = self.content_based_recommendation(
+            keywords, term_weights=term_weights, resource_filter=resource_filter
+        )
+        logger.debug(f"content_based_ids: {content_based_ids}")
+
+        # Get collaborative filtering recommendations
+        collab_ids = self.collaborative_filtering(user_id, wrong_question_ids, resource_filter=resource_filter)
+        logger.debug(f"collab_ids: {collab_ids}")
+
+        all_resource_ids = self.combine(content_based_ids, collab_ids)
+
+        logger.debug(f"All resource ids {all_resource_ids}")
+
+        ranking = []
+        for i, resource_id in enumerate(all_resource_ids):
+            # Calculate relevance score (higher for top recommendations)
+            relevance_score = 1.0 - (i / len(all_resource_ids)) if len(all_resource_ids) > 1 else 1.0
+            ranking.append((resource_id, relevance_score))
+        return ranking, keywords, len(wrong_question_ids)
+
+    def combine(self, content_based_ids, collab_ids):
+        """Combine and deduplicate recommendations"""
+        return list(set(content_based_ids + collab_ids))
+    
+    def generate_recommendations(self, user_id, quiz_attempt_id, resource_filter=None, ranker=None):
+        """Main method to generate and save recommendations, restricted to `resource_filter` if given
+
+        `ranker` stands in for self.rank, e.g. to rank in the scoring service.
+        The profile weights used are kept in `last_term_weights`, read before
+        this attempt is folded into the profile.
+        """
         try:
-            # Get wrong answers
-            wrong_answers = UserAnswer.objects.filter(
-                attempt_id=quiz_attempt_id,
-                is_correct=False
+            self.last_term_weights = self.profile_term_weights(user_id)
+            started = time.perf_counter()
+            ranking, keywords, wrong_answers = (ranker or self.rank)(
+                user_id, quiz_attempt_id, resource_filter, self.last_term_weights
             )
+            self.last_rank_ms = (time.perf_counter() - started) * 1000
             
-            if not wrong_answers.exists():
+            if not wrong_answers:
                 logger.info(f"No wrong answers for user {user_id} in quiz attempt {quiz_attempt_id}")
+                self.update_learning_profile(user_id, quiz_attempt_id, [], 0, 0)
                 return []
             
-            # Extract wrong question IDs
-            wrong_question_ids = [answer.question_id for answer in wrong_answers]
-            
-            # Extract keywords from wrong questions
-            keywords = self.extract_keywords_from_questions(wrong_question_ids)
-
-            print("Keywords", keywords)
-            
-            # Get content-based recommendations
-            content_based_ids = self.content_based_recommendation(keywords)
-            print(f"content_based_ids: {content_based_ids}")
-
-            # Get collaborative filtering recommendations
-            collab_ids = self.collaborative_filtering(user_id, wrong_question_ids)
-            print(f"collab_ids: {collab_ids}")
-
-            # Combine and deduplicate recommendations
-            all_resource_ids = list(set(content_based_ids + collab_ids))
-
-            print("All resource ids", all_resource_ids)
-            
             # Save recommendations
             quiz_attempt = UserQuizAttempt.objects.get(id=quiz_attempt_id)
             saved_recommendations = []
             
-            for i, resource_id in enumerate(all_resource_ids):
-                # Calculate relevance score (higher for top recommendations)
-                relevance_score = 1.0 - (i / len(all_resource_ids)) if len(all_resource_ids) > 1 else 1.0
-                
+            for resource_id, relevance_score in ranking:
                 recommendation, created = UserRecommendation.objects.update_or_create(
                     user_id=user_id,
                     resource_id=resource_id,
                     quiz_attempt=quiz_attempt,
-                    defaults={'relevance_score': relevance_score}
+                    defaults={'relevance_score': relevance_score, 'engine_version': self.version}
                 )
                 saved_recommendations.append(recommendation)
 
-            print("Saved recommendations", saved_recommendations)
+            logger.debug(f"Saved recommendations {saved_recommendations}")
+
+            self.update_learning_profile(
+                user_id, quiz_attempt_id, keywords, wrong_answers, len(saved_recommendations)
+            )
             return saved_recommendations
         except Exception as e:
             logger.error(f"Error generating recommendations: {e}")
-            return []
\ No newline at end of file
+            return []
+
+    def profile_term_weights(self, user_id):
+        """Weak keywords from the user's profile, scaled relative to the current attempt's keywords"""
+        try:
+            weak_keywords = profiles.get_weak_keywords(user_id)
+        except Exception as e:
+            logger.error(f"Error reading learning profile: {e}")
+            return {}
+        if not weak_keywords:
+            return {}
+        scale = getattr(settings, 'LEARNING_PROFILE_QUERY_WEIGHT', 0.5) / max(weak_keywords.values())
+        return {term: weight * scale for term, weight in weak_keywords.items()}
+
+    def update_learning_profile(self, user_id, quiz_attempt_id, keywords, wrong_answers, recommended):
+        """Fold this attempt into the user's learning profile"""
+        try:
+            quiz_attempt = UserQuizAttempt.objects.select_related('quiz').get(id=quiz_attempt_id)
+            total_answers = UserAnswer.objects.filter(attempt_id=quiz_attempt_id).count()
+            profiles.record_graded_attempt(
+                user_id, quiz_attempt, keywords, wrong_answers, total_answers, recommended
+            )
+        except Exception as e:
+            logger.error(f"Error updating learning profile: {e}")
+
+
+@register_engine
+class RankedMergeEngine(RecommendationEngine):
+    """Keeps the retrieval order when combining, so relevance follows the content scores"""
+    version = 'tfidf-cf-2'
+
+    def combine(self, content_based_ids, collab_ids):
+        # Content matches first in score order, then collaborative picks not already present
+        return list(dict.fromkeys(content_based_ids + collab_ids))
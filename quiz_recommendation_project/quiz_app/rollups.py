@@ -0,0 +1,119 @@
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import QuestionStat, QuizDailyStat, ResourceStat, UserAnswer, UserQuizAttempt, UserRecommendation
+
+
+def pass_score():
+    return getattr(settings, 'QUIZ_PASS_SCORE', 50)
+
+
+def increment_counters(model, key_field, deltas):
+    """Add per-row deltas ({key: {field: delta}}) with one UPDATE per distinct delta
+
+    Missing rows are created first with a single conflict-ignoring insert.
+    """
+    if not deltas:
+        return
+    model.objects.bulk_create([model(**{key_field: key}) for key in deltas], ignore_conflicts=True)
+
+    keys_by_update = defaultdict(list)
+    for key, fields in deltas.items():
+        update = tuple(sorted((field, delta) for field, delta in fields.items() if delta))
+        if update:
+            keys_by_update[update].append(key)
+    for update, keys in keys_by_update.items():
+        model.objects.filter(**{f'{key_field}__in': keys}).update(
+            **{field: F(field) + delta for field, delta in update}
+        )
+
+
+def record_graded_attempt(attempt):
+    """Fold a freshly graded attempt into the quiz, question and resource rollups"""
+    answers = list(UserAnswer.objects.filter(attempt=attempt).values_list('question_id', 'is_correct'))
+    recommended = UserRecommendation.objects.filter(quiz_attempt=attempt).values_list('resource_id', flat=True)
+    date = timezone.localdate(attempt.completed_at)
+    passed = int(attempt.score >= pass_score())
+
+    with transaction.atomic():
+        updated = QuizDailyStat.objects.filter(quiz_id=attempt.quiz_id, date=date).update(
+            attempts=F('attempts') + 1, passes=F('passes') + passed, total_score=F('total_score') + attempt.score
+        )
+        if not updated:
+            try:
+                with transaction.atomic():
+                    QuizDailyStat.objects.create(
+                        quiz_id=attempt.quiz_id, date=date, attempts=1, passes=passed, total_score=attempt.score
+                    )
+            except IntegrityError:
+                # Created concurrently by another attempt on the same day
+                QuizDailyStat.objects.filter(quiz_id=attempt.quiz_id, date=date).update(
+                    attempts=F('attempts') + 1, passes=F('passes') + passed,
+                    total_score=F('total_score') + attempt.score
+                )
+
+        question_deltas = defaultdict(Counter)
+        for question_id, is_correct in answers:
+            question_deltas[question_id]['answered'] += 1
+            question_deltas[question_id]['correct'] += int(is_correct)
+        increment_counters(QuestionStat, 'question_id', question_deltas)
+
+        increment_counters(ResourceStat, 'resource_id', {
+            resource_id: {'recommended': 1} for resource_id in recommended
+        })
+
+
+def record_feedback(resource_deltas):
+    """Apply {resource_id: {'viewed': n, 'clicked': n, 'dismissed': n}} from feedback events"""
+    increment_counters(ResourceStat, 'resource_id', resource_deltas)
+
+
+def rebuild_rollups(batch_size=1000):
+    """Recompute every rollup from the raw tables, for the initial backfill or after repairs"""
+    daily = (
+        UserQuizAttempt.objects.filter(completed=True, completed_at__isnull=False)
+        .annotate(day=TruncDate('completed_at'))
+        .values('quiz_id', 'day')
+        .annotate(
+            attempts=Count('id'),
+            passes=Count('id', filter=Q(score__gte=pass_score())),
+            total_score=Sum('score'),
+        )
+    )
+    questions = (
+        UserAnswer.objects.filter(attempt__completed=True)
+        .values('question_id')
+        .annotate(answered=Count('id'), correct=Count('id', filter=Q(is_correct=True)))
+    )
+    resources = (
+        UserRecommendation.objects.values('resource_id')
+        .annotate(
+            recommended=Count('id'),
+            viewed=Count('id', filter=Q(viewed=True)),
+            clicked=Count('id', filter=Q(clicked=True)),
+            dismissed=Count('id', filter=Q(dismissed=True)),
+        )
+    )
+
+    with transaction.atomic():
+        QuizDailyStat.objects.all().delete()
+        QuestionStat.objects.all().delete()
+        ResourceStat.objects.all().delete()
+        QuizDailyStat.objects.bulk_create((
+            QuizDailyStat(
+                quiz_id=row['quiz_id'], date=row['day'], attempts=row['attempts'],
+                passes=row['passes'], total_score=row['total_score'] or 0.0,
+            )
+            for row in daily.iterator(chunk_size=batch_size)
+        ), batch_size=batch_size)
+        QuestionStat.objects.bulk_create(
+            (QuestionStat(**row) for row in questions.iterator(chunk_size=batch_size)), batch_size=batch_size
+        )
+        ResourceStat.objects.bulk_create(
+            (ResourceStat(**row) for row in resources.iterator(chunk_size=batch_size)), batch_size=batch_size
+        )
@@ -0,0 +1,328 @@
+"""Recommendation scoring out of the web process
+
+`manage.py run_scoring_service` keeps the engines and the keyword index in a
+pool of pre-forked worker processes listening on a Unix socket or a local
+TCP port. Web processes talk to it through ScoringClient, which folds the
+rank calls of concurrent requests into one batch per round trip. Without
+RECOMMENDATION_SERVICE_ADDRESS (tests, development) InProcessScoring ranks
+in the calling thread instead.
+
+Frames are a 4-byte big-endian length followed by a JSON body:
+
+    {"requests": [{"id": 1, "engine": "tfidf-cf-1", "user_id": 3,
+                   "quiz_attempt_id": 9, "filter": null, "term_weights": null}, ...]}
+    {"results": [{"id": 1, "ranking": [[12, 1.0], ...], "keywords": [...],
+                  "wrong_answers": 2}, {"id": 2, "error": "..."}]}
+"""
+import json
+import logging
+import os
+import queue
+import signal
+import socket
+import struct
+import threading
+import time
+from itertools import count
+
+from django.conf import settings
+from django.db import close_old_connections, connections
+
+from .keyword_index import ResourceFilter, get_keyword_index
+from .recommendation import get_engine
+
+logger = logging.getLogger(__name__)
+
+HEADER = struct.Struct('>I')
+MAX_FRAME = 16 * 1024 * 1024
+
+
+class ScoringError(Exception):
+    """The scoring service ranked the request but the engine failed"""
+
+
+def parse_address(address):
+    """'unix:/path/to.sock' -> (AF_UNIX, path); 'host:port' -> (AF_INET, (host, port))"""
+    if address.startswith('unix:'):
+        return socket.AF_UNIX, address[len('unix:'):]
+    host, _, port = address.rpartition(':')
+    return socket.AF_INET, (host or '127.0.0.1', int(port))
+
+
+def send_frame(sock, message):
+    body = json.dumps(message).encode()
+    sock.sendall(HEADER.pack(len(body)) + body)
+
+
+def recv_exactly(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 65536))
+        if not chunk:
+            raise ConnectionError('Connection closed mid-frame')
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def recv_frame(sock):
+    """Next message on the socket, or None when the peer closed between frames"""
+    header = sock.recv(HEADER.size, socket.MSG_WAITALL)
+    if not header:
+        return None
+    if len(header) < HEADER.size:
+        header += recv_exactly(sock, HEADER.size - len(header))
+    (size,) = HEADER.unpack(header)
+    if size > MAX_FRAME:
+        raise ValueError(f'Frame of {size} bytes exceeds the {MAX_FRAME} byte limit')
+    return json.loads(recv_exactly(sock, size))
+
+
+def score_requests(requests, engines=None):
+    """Rank a batch of request dicts, returning one result dict per request"""
+    engines = {} if engines is None else engines
+    results = []
+    for request in requests:
+        try:
+            version = request['engine']
+            if version not in engines:
+                engines[version] = get_engine(version)
+            resource_filter = ResourceFilter.from_dict(request['filter']) if request.get('filter') else None
+            ranking, keywords, wrong_answers = engines[version].rank(
+                request['user_id'], request['quiz_attempt_id'], resource_filter, request.get('term_weights')
+            )
+            results.append({
+                'id': request['id'],
+                'ranking': [[int(resource_id), float(score)] for resource_id, score in ranking],
+                'keywords': [str(k) for k in keywords],
+                'wrong_answers': wrong_answers,
+            })
+        except Exception as e:
+            logger.error(f"Error scoring request {request.get('id')}: {e}")
+            results.append({'id': request.get('id'), 'error': str(e)})
+    return results
+
+
+class ScoringServer:
+    """Accepts on one listening socket from `workers` forked processes"""
+
+    def __init__(self, address, workers=4, backlog=128):
+        self.address = address
+        self.workers = workers
+        self.backlog = backlog
+        self.children = set()
+        self.running = False
+        self.sock = None
+
+    def bind(self):
+        family, target = parse_address(self.address)
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        if family == socket.AF_UNIX:
+            if os.path.exists(target):
+                os.unlink(target)
+            sock.bind(target)
+            os.chmod(target, 0o660)
+        else:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.bind(target)
+        sock.listen(self.backlog)
+        self.sock = sock
+
+    def serve_forever(self):
+        self.bind()
+        # Loaded before forking so the workers share the index pages
+        get_keyword_index()
+        connections.close_all()
+
+        self.running = True
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        for _ in range(self.workers):
+            self.spawn()
+        logger.info(f"Scoring service on {self.address} with {self.workers} workers")
+
+        while self.children:
+            try:
+                pid, _ = os.wait()
+            except ChildProcessError:
+                break
+            self.children.discard(pid)
+            if self.running:
+                logger.warning(f"Scoring worker {pid} exited, starting a replacement")
+                self.spawn()
+
+        self.sock.close()
+        family, target = parse_address(self.address)
+        if family == socket.AF_UNIX and os.path.exists(target):
+            os.unlink(target)
+
+    def stop(self, signum, frame):
+        self.running = False
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def spawn(self):
+        pid = os.fork()
+        if pid:
+            self.children.add(pid)
+            return
+        # Child: die on the parent's SIGTERM, leave Ctrl-C to the parent
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        try:
+            self.work()
+        finally:
+            os._exit(0)
+
+    def work(self):
+        engines = {}
+        while True:
+            conn, _ = self.sock.accept()
+            with conn:
+                try:
+                    while True:
+                        message = recv_frame(conn)
+                        if message is None:
+                            break
+                        close_old_connections()
+                        send_frame(conn, {'results': score_requests(message.get('requests', ()), engines)})
+                except (OSError, ValueError) as e:
+                    logger.error(f"Scoring connection failed: {e}")
+
+
+class _Pending:
+    def __init__(self, request):
+        self.request = request
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class InProcessScoring:
+    """Ranks in the calling thread; used when no scoring service is configured"""
+
+    def rank(self, version, user_id, quiz_attempt_id, resource_filter=None, term_weights=None):
+        return get_engine(version).rank(user_id, quiz_attempt_id, resource_filter, term_weights)
+
+    def ranker(self, version):
+        return lambda user_id, quiz_attempt_id, resource_filter=None, term_weights=None: self.rank(
+            version, user_id, quiz_attempt_id, resource_filter, term_weights
+        )
+
+
+class ScoringClient(InProcessScoring):
+    """Micro-batches concurrent rank calls from this process into service round trips
+
+    Each of `connections` dispatcher threads takes the first queued call,
+    waits up to `max_wait` seconds for more, and sends them as one frame.
+    If the service cannot be reached in time, the call is ranked in process.
+    """
+
+    def __init__(self, address, max_batch=32, max_wait=0.002, connections=4, timeout=10):
+        self.address = address
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.connections = connections
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.ids = count(1)
+        self.pid = None
+
+    def start(self):
+        # Dispatcher threads do not survive a fork, so start them per process
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.queue = queue.Queue()
+            for _ in range(self.connections):
+                threading.Thread(target=self.dispatch, name='scoring-client', daemon=True).start()
+            self.pid = os.getpid()
+
+    def rank(self, version, user_id, quiz_attempt_id, resource_filter=None, term_weights=None):
+        self.start()
+        call = _Pending({
+            'id': next(self.ids),
+            'engine': version,
+            'user_id': user_id,
+            'quiz_attempt_id': quiz_attempt_id,
+            'filter': resource_filter.to_dict() if resource_filter is not None else None,
+            'term_weights': term_weights,
+        })
+        self.queue.put(call)
+        if not call.event.wait(self.timeout) or isinstance(call.error, OSError):
+            # Ranking has no side effects, so running it here as well is safe
+            logger.warning(f"Scoring service {self.address} unavailable ({call.error or 'timed out'}), ranking in process")
+            return super().rank(version, user_id, quiz_attempt_id, resource_filter, term_weights)
+        if call.error is not None:
+            raise ScoringError(str(call.error))
+        result = call.result
+        if 'error' in result:
+            raise ScoringError(result['error'])
+        ranking = [(resource_id, score) for resource_id, score in result['ranking']]
+        return ranking, result['keywords'], result['wrong_answers']
+
+    def next_batch(self):
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def dispatch(self):
+        while True:
+            batch = self.next_batch()
+            try:
+                results = {r['id']: r for r in self.send([call.request for call in batch])}
+                for call in batch:
+                    call.result = results.get(call.request['id'], {'error': 'Missing from service response'})
+            except Exception as e:
+                for call in batch:
+                    call.error = e
+            finally:
+                for call in batch:
+                    call.event.set()
+
+    def send(self, requests):
+        family, target = parse_address(self.address)
+        # One short connection per batch, so no worker is pinned by an idle client
+        with socket.socket(family, socket.SOCK_STREAM) as sock:
+            sock.settimeout(self.timeout)
+            sock.connect(target)
+            send_frame(sock, {'requests': requests})
+            message = recv_frame(sock)
+        if message is None:
+            raise ConnectionError('Scoring service closed the connection')
+        return message['results']
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_scoring_client():
+    """Process-wide scoring client, in-process unless RECOMMENDATION_SERVICE_ADDRESS is set"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                address = getattr(settings, 'RECOMMENDATION_SERVICE_ADDRESS', None)
+                if address:
+                    _client = ScoringClient(
+                        address,
+                        max_batch=getattr(settings, 'RECOMMENDATION_SERVICE_MAX_BATCH', 32),
+                        max_wait=getattr(settings, 'RECOMMENDATION_SERVICE_MAX_WAIT_MS', 2) / 1000,
+                        connections=getattr(settings, 'RECOMMENDATION_SERVICE_CONNECTIONS', 4),
+                        timeout=getattr(settings, 'RECOMMENDATION_SERVICE_TIMEOUT', 10),
+                    )
+                else:
+                    _client = InProcessScoring()
+    return _client
@@ -2,6 +2,32 @@ from rest_framework import serializers
 from .models import *
 from django.contrib.auth.models import User
 
+class DynamicFieldsMixin:
+    """Accepts a `fields` kwarg listing the fields to keep
+
+    Dotted names select fields of a nested serializer that also uses this
+    mixin, e.g. ['id', 'resource.title'] keeps only the resource's title.
+    """
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if fields is None:
+            return
+        
+        nested = {}
+        for name in fields:
+            head, _, rest = name.partition('.')
+            nested.setdefault(head, [])
+            if rest:
+                nested[head].append(rest)
+        
+        for name in set(self.fields) - set(nested):
+            self.fields.pop(name)
+        for name, sub_fields in nested.items():
+            field = self.fields.get(name)
+            if sub_fields and isinstance(field, DynamicFieldsMixin):
+                self.fields[name] = type(field)(read_only=True, fields=sub_fields)
+
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
@@ -60,16 +86,88 @@ class KeywordSerializer(serializers.ModelSerializer):
         model = Keyword
         fields = ('id', 'text')
 
-class ResourceSerializer(serializers.ModelSerializer):
+class ResourceSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     keywords = KeywordSerializer(many=True, read_only=True)
     
     class Meta:
         model = Resource
         fields = ('id', 'title', 'description', 'url', 'resource_type', 'keywords', 'rating')
 
-class UserRecommendationSerializer(serializers.ModelSerializer):
+class UserRecommendationSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     resource = ResourceSerializer(read_only=True)
     
     class Meta:
         model = UserRecommendation
         fields = ('id', 'resource', 'relevance_score', 'created_at', 'viewed')
+
+class SideloadedRecommendationSerializer(UserRecommendationSerializer):
+    """Recommendation referring to its resource by id; resources are sent once alongside"""
+    resource = serializers.PrimaryKeyRelatedField(read_only=True)
+
+def serialize_recommendations(recommendations, fields=None, sideload=False):
+    """Serialize recommendations, returning (recommendations, resources)
+
+    `resources` is None unless `sideload` is set, in which case every
+    distinct resource is serialized once and recommendations carry its id.
+    A sparse fieldset that names no resource field sideloads no resources.
+    """
+    if not sideload:
+        return UserRecommendationSerializer(recommendations, many=True, fields=fields).data, None
+    
+    resource_fields = None
+    if fields is not None:
+        dotted = [f.partition('.')[2] for f in fields if f.startswith('resource.')]
+        if dotted:
+            # Recommendations keep the resource id so clients can join on it
+            resource_fields = ['id'] + dotted
+            fields = [f for f in fields if not f.startswith('resource.')] + ['resource']
+        elif 'resource' not in fields:
+            return SideloadedRecommendationSerializer(recommendations, many=True, fields=fields).data, []
+    recommendations = list(recommendations)
+    resources = list({r.resource_id: r.resource for r in recommendations}.values())
+    return (
+        SideloadedRecommendationSerializer(recommendations, many=True, fields=fields).data,
+        ResourceSerializer(resources, many=True, fields=resource_fields).data,
+    )
+
+class FeedbackEventSerializer(serializers.Serializer):
+    recommendation_id = serializers.IntegerField()
+    event = serializers.ChoiceField(choices=['view', 'click', 'dismiss'])
+
+class RecommendationFeedbackSerializer(serializers.Serializer):
+    events = FeedbackEventSerializer(many=True, allow_empty=False, max_length=500)
+
+class QuizDailyStatSerializer(serializers.ModelSerializer):
+    pass_rate = serializers.SerializerMethodField()
+    average_score = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = QuizDailyStat
+        fields = ('quiz', 'date', 'attempts', 'passes', 'pass_rate', 'average_score')
+    
+    def get_pass_rate(self, obj):
+        return obj.passes / obj.attempts if obj.attempts else None
+    
+    def get_average_score(self, obj):
+        return obj.total_score / obj.attempts if obj.attempts else None
+
+class QuestionStatSerializer(serializers.ModelSerializer):
+    quiz = serializers.IntegerField(source='question.quiz_id', read_only=True)
+    error_rate = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = QuestionStat
+        fields = ('question', 'quiz', 'answered', 'correct', 'error_rate')
+    
+    def get_error_rate(self, obj):
+        return 1 - obj.correct / obj.answered if obj.answered else None
+
+class ResourceStatSerializer(serializers.ModelSerializer):
+    view_through = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = ResourceStat
+        fields = ('resource', 'recommended', 'viewed', 'clicked', 'dismissed', 'view_through')
+    
+    def get_view_through(self, obj):
+        return obj.viewed / obj.recommended if obj.recommended else None
@@ -0,0 +1,91 @@
+"""Shadow evaluation of a candidate engine on live submissions
+
+A sampled share of graded attempts is ranked a second time by the engine
+named in RECOMMENDATION_SHADOW_ENGINE, on a background thread so the
+response never waits for it. Nothing the shadow engine produces is saved;
+its latency and overlap with the primary ranking are logged.
+"""
+import hashlib
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection
+
+from .scoring import get_scoring_client
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def shadow_engine_version():
+    return getattr(settings, 'RECOMMENDATION_SHADOW_ENGINE', None)
+
+
+def sample_rate():
+    return getattr(settings, 'RECOMMENDATION_SHADOW_SAMPLE_RATE', 0.0)
+
+
+def is_sampled(quiz_attempt_id):
+    """Stable per attempt, so retries and replays agree on whether it was shadowed"""
+    digest = hashlib.sha256(str(quiz_attempt_id).encode()).digest()
+    return int.from_bytes(digest[:8], 'big') / 2 ** 64 < sample_rate()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'RECOMMENDATION_SHADOW_WORKERS', 2),
+            thread_name_prefix='shadow-engine',
+        )
+    return _executor
+
+
+def overlap(primary_ids, shadow_ids):
+    """Jaccard overlap of two rankings' resource sets, 1.0 when both are empty"""
+    primary_ids, shadow_ids = set(primary_ids), set(shadow_ids)
+    union = primary_ids | shadow_ids
+    return len(primary_ids & shadow_ids) / len(union) if union else 1.0
+
+
+def maybe_run_shadow(user_id, quiz_attempt_id, primary_version, primary_ids, primary_ms,
+                     resource_filter=None, term_weights=None):
+    """Queue a shadow ranking of this attempt if a shadow engine is configured and it is sampled
+
+    `term_weights` should be the profile weights the primary ranked with: by
+    the time the shadow runs, the profile already includes this attempt.
+    """
+    version = shadow_engine_version()
+    if not version or version == primary_version or not is_sampled(quiz_attempt_id):
+        return None
+    return get_executor().submit(
+        run_shadow, version, user_id, quiz_attempt_id, primary_version, primary_ids, primary_ms,
+        resource_filter, term_weights,
+    )
+
+
+def run_shadow(version, user_id, quiz_attempt_id, primary_version, primary_ids, primary_ms,
+               resource_filter, term_weights):
+    try:
+        started = time.perf_counter()
+        ranking, _, _ = get_scoring_client().rank(
+            version, user_id, quiz_attempt_id, resource_filter, term_weights
+        )
+        shadow_ms = (time.perf_counter() - started) * 1000
+        shadow_ids = [resource_id for resource_id, _ in ranking]
+        top_match = bool(primary_ids and shadow_ids and primary_ids[0] == shadow_ids[0])
+        logger.info(
+            f"Shadow {version} vs {primary_version} on attempt {quiz_attempt_id}: "
+            f"{shadow_ms:.1f}ms vs {primary_ms:.1f}ms, overlap {overlap(primary_ids, shadow_ids):.2f}, "
+            f"top match {top_match}, {len(shadow_ids)} vs {len(primary_ids)} results"
+        )
+        return shadow_ids, shadow_ms
+    except Exception as e:
+        logger.error(f"Shadow engine {version} failed on attempt {quiz_attempt_id}: {e}")
+        return None
+    finally:
+        # Executor threads outlive the request, so release their connection here
+        connection.close()
@@ -0,0 +1,48 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .keyword_index import notify_index_changed
+from .models import IndexChange, Keyword, Resource
+
+# Only what the keyword index consumes (changelog.affected_resource_ids); logging
+# more would cost every quiz submission inserts nobody reads
+TRACKED_MODELS = (Resource, Keyword)
+
+
+def record_changes(model, object_ids, action=IndexChange.SAVE):
+    IndexChange.objects.bulk_create([
+        IndexChange(model=model._meta.model_name, object_id=object_id, action=action)
+        for object_id in object_ids
+    ])
+    notify_index_changed()
+
+
+def tracked_post_save(sender, instance, **kwargs):
+    record_changes(sender, [instance.pk])
+
+
+def tracked_post_delete(sender, instance, **kwargs):
+    record_changes(sender, [instance.pk], IndexChange.DELETE)
+
+
+for model in TRACKED_MODELS:
+    post_save.connect(tracked_post_save, sender=model, dispatch_uid=f'index_change_save_{model.__name__}')
+    post_delete.connect(tracked_post_delete, sender=model, dispatch_uid=f'index_change_delete_{model.__name__}')
+
+
+@receiver(pre_delete, sender=Keyword)
+def keyword_pre_delete(sender, instance, **kwargs):
+    # The through rows are gone by post_delete, so log the affected resources now
+    record_changes(Resource, instance.resources.values_list('id', flat=True))
+
+
+@receiver(m2m_changed, sender=Resource.keywords.through)
+def resource_keywords_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            record_changes(Resource, [instance.pk])
+    elif action in ('post_add', 'post_remove'):
+        # keyword.resources.add(...) / remove(...): pk_set holds resource ids
+        record_changes(Resource, pk_set)
+    elif action == 'pre_clear':
+        record_changes(Resource, instance.resources.values_list('id', flat=True))
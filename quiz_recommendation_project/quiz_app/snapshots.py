@@ -0,0 +1,114 @@
+import json
+import os
+import shutil
+import time
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+
+CURRENT = 'CURRENT'
+MANIFEST = 'manifest.json'
+FORMAT_VERSION = 2  # 2: resource_types, ratings and created_at columns
+
+
+def snapshot_root():
+    return Path(getattr(settings, 'RECOMMENDATION_INDEX_DIR', settings.BASE_DIR / 'recommendation_index'))
+
+
+def new_version():
+    """Sortable, collision-free snapshot version tag"""
+    return f"{time.strftime('%Y%m%dT%H%M%S', time.gmtime())}-{uuid.uuid4().hex[:8]}"
+
+
+def write_snapshot(index, root=None, metadata=None, keep=3):
+    """Atomically publish `index` as a new snapshot version and return the version tag
+
+    Arrays are written into a hidden temporary directory which is renamed
+    into place once complete, and only then is CURRENT swapped to point at
+    it, so readers never observe a half-written snapshot.
+    """
+    root = Path(root or snapshot_root())
+    root.mkdir(parents=True, exist_ok=True)
+    version = new_version()
+    staging = root / f'.tmp-{version}'
+
+    index.save(staging)
+    manifest = {
+        'format': FORMAT_VERSION,
+        'version': version,
+        'created_at': time.time(),
+        'resources': len(index),
+        'terms': len(index.terms),
+        'postings': len(index.indices),
+    }
+    manifest.update(metadata or {})
+    with open(staging / MANIFEST, 'w') as f:
+        json.dump(manifest, f)
+        f.flush()
+        os.fsync(f.fileno())
+
+    os.rename(staging, root / version)
+
+    pointer = root / f'.{CURRENT}.{version}'
+    with open(pointer, 'w') as f:
+        f.write(version)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(pointer, root / CURRENT)
+
+    prune_snapshots(root, keep)
+    return version
+
+
+def current_version(root=None):
+    """Version tag CURRENT points at, or None when no snapshot was published"""
+    try:
+        return (Path(root or snapshot_root()) / CURRENT).read_text().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def read_manifest(version, root=None):
+    with open(Path(root or snapshot_root()) / version / MANIFEST) as f:
+        return json.load(f)
+
+
+def check_format(manifest):
+    """Raise ValueError for a snapshot written with a different array layout"""
+    if manifest.get('format') != FORMAT_VERSION:
+        raise ValueError(
+            f"snapshot {manifest.get('version')} has format {manifest.get('format')}, expected {FORMAT_VERSION}"
+        )
+    return manifest
+
+
+def update_manifest(version, root=None, metadata=None):
+    """Atomically merge `metadata` into a published snapshot's manifest
+
+    Used to advance the watermark when the logged changes left the arrays
+    untouched, instead of publishing an identical copy.
+    """
+    directory = Path(root or snapshot_root()) / version
+    manifest = read_manifest(version, root)
+    manifest.update(metadata or {})
+    staging = directory / f'.{MANIFEST}.{uuid.uuid4().hex[:8]}'
+    with open(staging, 'w') as f:
+        json.dump(manifest, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(staging, directory / MANIFEST)
+    return manifest
+
+
+def prune_snapshots(root, keep):
+    """Delete all but the newest `keep` versions
+
+    Workers still mapping an older version keep their pages alive until they
+    swap, since unlinking a mapped file does not invalidate the mapping.
+    """
+    current = current_version(root)
+    versions = sorted(p.name for p in Path(root).iterdir() if p.is_dir() and not p.name.startswith('.'))
+    for version in versions[:-keep] if keep else versions:
+        if version != current:
+            shutil.rmtree(Path(root) / version, ignore_errors=True)
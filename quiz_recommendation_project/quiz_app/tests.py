@@ -1,3 +1,982 @@
-from django.test import TestCase
+import gzip
+import io
+import json
+import math
+import socket
+import tempfile
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from unittest import mock
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from unittest import skipUnless
 
-# Create your tests here.
+import numpy as np
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import QuerySet
+from django.utils import timezone as django_timezone
+from django.utils.translation import gettext_lazy
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from . import profiles, snapshots
+from .admin import EstimatedCountPaginator
+from .catalog import CatalogImporter, read_records
+from .coalescing import RequestCoalescer, RequestInProgress
+from .feedback import apply_feedback
+from .serializers import serialize_recommendations
+from .middleware import brotli
+from .renderers import ORJSONRenderer, orjson
+from .keyword_index import IndexHolder, KeywordIndex, ResourceFilter, ResourceRow
+from .models import *
+from .recommendation import RecommendationEngine
+from .scoring import (
+    MAX_FRAME, InProcessScoring, ScoringClient, ScoringError, recv_frame, score_requests, send_frame,
+)
+
+
+def random_index(rng, n_resources=400, n_terms=60):
+    """Random index plus its raw rows, as ResourceRows keyed by resource id"""
+    terms = np.array([f'term{i}' for i in range(n_terms)])
+    rows = {}
+    for resource_id in range(1000, 1000 + n_resources):
+        chosen = rng.choice(n_terms, rng.integers(1, 8), replace=False)
+        rows[resource_id] = ResourceRow(
+            Counter({str(terms[t]): int(rng.integers(1, 4)) for t in chosen}),
+            int(rng.integers(1, 4)),
+            float(rng.uniform(0, 5)),
+            int(rng.integers(1_600_000_000, 1_700_000_000)),
+        )
+    return index_from_rows(terms, rows), rows
+
+
+def index_from_rows(terms, rows):
+    vocabulary = {term: i for i, term in enumerate(terms.tolist())}
+    resource_ids = sorted(rows)
+    indptr, indices, counts = [0], [], []
+    for resource_id in resource_ids:
+        row = sorted((vocabulary[term], count) for term, count in rows[resource_id].term_counts.items())
+        indices += [term_id for term_id, _ in row]
+        counts += [count for _, count in row]
+        indptr.append(len(indices))
+    return KeywordIndex.from_postings(
+        terms,
+        np.array(resource_ids, dtype=np.int64),
+        np.array(indptr, dtype=np.int64),
+        np.array(indices, dtype=np.int32),
+        np.array(counts, dtype=np.float32),
+        np.array([rows[r].resource_type for r in resource_ids], dtype=np.int64),
+        np.array([rows[r].rating for r in resource_ids], dtype=np.float32),
+        np.array([rows[r].created_at for r in resource_ids], dtype=np.int64),
+    )
+
+
+def exhaustive_search(index, keywords, limit, term_weights=None, resource_filter=None):
+    """Cosine score of every resource, top `limit` positive ones"""
+    term_ids, weights = index.query_vector(keywords, term_weights)
+    query = np.zeros(len(index.terms), dtype=np.float64)
+    query[term_ids] = weights
+    scores = np.zeros(len(index), dtype=np.float64)
+    for row in range(len(index)):
+        start, end = index.indptr[row], index.indptr[row + 1]
+        scores[row] = np.dot(index.data[start:end], query[index.indices[start:end]])
+    if resource_filter is not None:
+        scores[~resource_filter.allows(index, np.arange(len(index)))] = 0.0
+    best = np.argsort(-scores, kind='stable')[:limit]
+    return [(int(index.resource_ids[row]), scores[row]) for row in best if scores[row] > 0]
+
+
+def make_quiz(question_count=4):
+    """Quiz whose questions each have one correct and one wrong option"""
+    subject = Subject.objects.create(name='Maths', description='')
+    quiz = Quiz.objects.create(subject=subject, title='Calculus', description='')
+    for i in range(question_count):
+        question = Question.objects.create(quiz=quiz, text=f'Question {i} about limits')
+        Option.objects.create(question=question, text='Right', is_correct=True)
+        Option.objects.create(question=question, text='Wrong', is_correct=False)
+    return quiz
+
+
+def answers_for(quiz, correct):
+    """Submission answering the first `correct` questions right and the rest wrong"""
+    return [
+        {'question_id': q.id, 'selected_option_id': q.options.get(is_correct=i < correct).id}
+        for i, q in enumerate(quiz.questions.order_by('id'))
+    ]
+
+
+def make_recommendations(user, quiz, count):
+    """`count` recommendations of fresh resources on the user's completed attempt at `quiz`"""
+    attempt, _ = UserQuizAttempt.objects.get_or_create(user=user, quiz=quiz, defaults={'completed': True})
+    resource_type, _ = ResourceType.objects.get_or_create(name='Article')
+    return [
+        UserRecommendation.objects.create(
+            user=user, quiz_attempt=attempt, relevance_score=1.0,
+            resource=Resource.objects.create(
+                title=f'Resource {i}', description='', url=f'https://example.com/{user.id}/{i}',
+                resource_type=resource_type, rating=3.0,
+            ),
+        )
+        for i in range(count)
+    ]
+
+
+def isolate_keyword_index(test):
+    """Give a test its own snapshot directory and a fresh process-wide index"""
+    root = tempfile.TemporaryDirectory()
+    test.addCleanup(root.cleanup)
+    settings_override = override_settings(RECOMMENDATION_INDEX_DIR=Path(root.name))
+    settings_override.enable()
+    test.addCleanup(settings_override.disable)
+    holder = mock.patch('quiz_app.keyword_index._holder', IndexHolder())
+    holder.start()
+    test.addCleanup(holder.stop)
+
+
+class KeywordIndexSearchTests(SimpleTestCase):
+    def setUp(self):
+        self.rng = np.random.default_rng(7)
+        self.index, self.rows = random_index(self.rng)
+
+    def random_query(self):
+        return [f'term{i}' for i in self.rng.choice(60, self.rng.integers(1, 12), replace=False)]
+
+    def assertSameRanking(self, results, expected):
+        # Ties may come back in either order, so compare the scores and the sets above the last one
+        self.assertEqual(len(results), len(expected))
+        np.testing.assert_allclose([s for _, s in results], [s for _, s in expected], rtol=1e-5, atol=1e-6)
+        if expected:
+            cutoff = expected[-1][1] + 1e-5
+            self.assertEqual(
+                {r for r, s in results if s > cutoff},
+                {r for r, s in expected if s > cutoff},
+            )
+
+    def test_matches_exhaustive_search(self):
+        for _ in range(100):
+            keywords = self.random_query()
+            self.assertSameRanking(self.index.search(keywords, 5), exhaustive_search(self.index, keywords, 5))
+
+    def test_matches_exhaustive_search_with_term_weights(self):
+        for _ in range(100):
+            keywords = self.random_query()
+            term_weights = {term: float(self.rng.uniform(0.1, 1.0)) for term in self.random_query()}
+            self.assertSameRanking(
+                self.index.search(keywords, 5, term_weights=term_weights),
+                exhaustive_search(self.index, keywords, 5, term_weights=term_weights),
+            )
+
+    def test_matches_exhaustive_search_with_resource_filter(self):
+        resource_filter = ResourceFilter([1, 2], 2.0, datetime.fromtimestamp(1_650_000_000, dt_timezone.utc))
+        for _ in range(100):
+            keywords = self.random_query()
+            results = self.index.search(keywords, 5, resource_filter=resource_filter)
+            self.assertSameRanking(results, exhaustive_search(self.index, keywords, 5, resource_filter=resource_filter))
+            for resource_id, _ in results:
+                row = self.rows[resource_id]
+                self.assertIn(row.resource_type, (1, 2))
+                self.assertGreaterEqual(row.rating, 2.0)
+                self.assertGreaterEqual(row.created_at, 1_650_000_000)
+
+    def test_unknown_keywords_return_nothing(self):
+        self.assertEqual(self.index.search(['missing'], 5), [])
+
+    def test_with_resources_matches_rebuild(self):
+        rows = dict(self.rows)
+        updates = {
+            1000: None,  # deleted
+            1001: ResourceRow(Counter(), 1, 1.0, 1_600_000_000),  # lost all its keywords
+            1002: ResourceRow(Counter({'term3': 2, 'brandnew': 1}), 2, 4.5, 1_690_000_000),
+            5000: ResourceRow(Counter({'term4': 1, 'brandnew': 3}), 3, 3.0, 1_695_000_000),
+        }
+        updated = self.index.with_resources(updates)
+        for resource_id, row in updates.items():
+            if row is None or not row.term_counts:
+                rows.pop(resource_id)
+            else:
+                rows[resource_id] = row
+        rebuilt = index_from_rows(updated.terms, rows)
+
+        self.assertEqual(sorted(updated.resource_ids.tolist()), sorted(rows))
+        self.assertNotIn(1000, updated.resource_ids.tolist())
+        row = updated.resource_ids.tolist().index(5000)
+        self.assertEqual((updated.resource_types[row], updated.created_at[row]), (3, 1_695_000_000))
+        for _ in range(50):
+            keywords = self.random_query() + ['brandnew']
+            self.assertSameRanking(updated.search(keywords, 5), exhaustive_search(rebuilt, keywords, 5))
+
+
+class ApplyIndexChangesTests(TestCase):
+    def setUp(self):
+        isolate_keyword_index(self)
+        self.root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.root.cleanup)
+        resource_type = ResourceType.objects.create(name='Article')
+        self.resource = Resource.objects.create(
+            title='Limits', description='', url='https://example.com/limits', resource_type=resource_type, rating=4.0
+        )
+        self.resource.keywords.add(Keyword.objects.create(text='limits'))
+
+    def apply_changes(self):
+        call_command('apply_index_changes', output=self.root.name, stdout=io.StringIO())
+        version = snapshots.current_version(self.root.name)
+        return version, snapshots.read_manifest(version, self.root.name)
+
+    def test_quiz_activity_is_not_logged(self):
+        subject = Subject.objects.create(name='Maths', description='')
+        quiz = Quiz.objects.create(subject=subject, title='Calculus', description='')
+        question = Question.objects.create(quiz=quiz, text='What is a limit?')
+        Option.objects.create(question=question, text='A value', is_correct=True)
+        self.assertFalse(IndexChange.objects.filter(model__in=['question', 'option']).exists())
+
+    def test_unindexed_changes_only_advance_the_watermark(self):
+        version, manifest = self.apply_changes()
+        Keyword.objects.create(text='unused')
+        latest = IndexChange.objects.latest('id').id
+
+        self.assertEqual(self.apply_changes(), (version, {**manifest, 'watermark': latest}))
+
+    def test_snapshot_in_an_older_format_is_rebuilt(self):
+        version, manifest = self.apply_changes()
+        # Layout from before the attribute columns existed
+        (Path(self.root.name) / version / 'ratings.npy').unlink()
+        snapshots.update_manifest(version, self.root.name, {'format': 1})
+
+        new_version, manifest = self.apply_changes()
+        self.assertNotEqual(new_version, version)
+        self.assertEqual(manifest['format'], snapshots.FORMAT_VERSION)
+
+    def test_resource_changes_publish_a_snapshot(self):
+        version, _ = self.apply_changes()
+        self.resource.keywords.add(Keyword.objects.create(text='continuity'))
+
+        new_version, manifest = self.apply_changes()
+        self.assertNotEqual(new_version, version)
+        self.assertEqual(manifest['watermark'], IndexChange.objects.latest('id').id)
+        index = KeywordIndex.load(Path(self.root.name) / new_version)
+        self.assertEqual(index.search(['continuity'], 5)[0][0], self.resource.id)
+
+
+class RequestCoalescerTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def run_concurrently(self, coalescer, compute, count=4):
+        outcomes = []
+
+        def call():
+            try:
+                outcomes.append(coalescer.run('key', compute))
+            except RequestInProgress:
+                outcomes.append('in progress')
+
+        threads = [threading.Thread(target=call) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+            time.sleep(0.01)
+        for thread in threads:
+            thread.join()
+        return outcomes
+
+    def test_duplicates_share_one_computation(self):
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.2)
+            return 'result'
+
+        outcomes = self.run_concurrently(RequestCoalescer('test'), compute)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sorted(outcomes), [('result', False)] + [('result', True)] * 3)
+        self.assertEqual(RequestCoalescer('test').run('key', compute), ('result', True))
+
+    def test_duplicate_outwaiting_the_lock_timeout_is_told_to_retry(self):
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.6)
+            return 'result'
+
+        outcomes = self.run_concurrently(RequestCoalescer('test', lock_timeout=0.2), compute, count=2)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sorted(outcomes, key=str), [('result', False), 'in progress'])
+
+
+class SubmitQuizConcurrencyTests(TransactionTestCase):
+    def setUp(self):
+        isolate_keyword_index(self)
+        cache.clear()
+        self.user = User.objects.create_user('student', password='secret')
+        self.quiz = make_quiz()
+
+    def test_duplicate_submissions_grade_and_rank_once(self):
+        calls = []
+        original_rank = RecommendationEngine.rank
+
+        def slow_rank(engine, *args, **kwargs):
+            calls.append(1)
+            time.sleep(0.3)
+            return original_rank(engine, *args, **kwargs)
+
+        responses = []
+
+        def submit():
+            client = APIClient()
+            client.force_authenticate(self.user)
+            responses.append(client.post(
+                '/api/submit-quiz/', {'quiz_id': self.quiz.id, 'answers': answers_for(self.quiz, 2)}, format='json'
+            ))
+            connection.close()
+
+        with mock.patch.object(RecommendationEngine, 'rank', autospec=True, side_effect=slow_rank):
+            threads = [threading.Thread(target=submit) for _ in range(5)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            submit()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual([r.status_code for r in responses], [200] * 6)
+        self.assertEqual(sum(1 for r in responses if r.headers.get('Idempotent-Replayed')), 5)
+        self.assertEqual({r.data['attempt_id'] for r in responses}, {UserQuizAttempt.objects.get().id})
+        self.assertEqual(UserAnswer.objects.count(), 4)
+
+    def test_submission_still_in_progress_gets_409(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        with mock.patch('quiz_app.views.submit_quiz_coalescer.run', side_effect=RequestInProgress('key')):
+            response = client.post(
+                '/api/submit-quiz/', {'quiz_id': self.quiz.id, 'answers': answers_for(self.quiz, 2)}, format='json'
+            )
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response['Retry-After'], '1')
+
+
+class CatalogImportTests(TestCase):
+    def test_invalid_records_are_reported_and_skipped(self):
+        records = [
+            {'type': 'quiz', 'key': 'q1', 'subject': 'Maths', 'title': 'Limits'},
+            {'type': 'quiz', 'key': 'q2', 'title': 'No subject'},
+            {'type': 'question', 'quiz': 'q1', 'text': 'What is a limit?',
+             'options': [{'text': 'A value', 'is_correct': True}]},
+            {'type': 'question', 'quiz': 'q1', 'text': 'Broken', 'options': [{'is_correct': True}]},
+            {'type': 'resource', 'title': 'No url'},
+            {'type': 'resource', 'title': 'Bad rating', 'url': 'https://example.com/a', 'rating': 'great'},
+            {'type': 'resource', 'title': 'Limits video', 'url': 'https://example.com/b', 'keywords': ['limits']},
+            {'type': 'lesson', 'title': 'Unknown'},
+            {'type': 'resource', 'title': 'Keyword string', 'url': 'https://example.com/c', 'keywords': 'algebra'},
+            {'type': 'resource', 'title': 42, 'url': 'https://example.com/d'},
+            {'type': 'question', 'quiz': 'q1', 'text': 'Options string', 'options': 'A value'},
+            {'type': 'question', 'quiz': 'q1', 'text': ['not', 'text']},
+            ['not', 'a', 'record'],
+        ]
+        importer = CatalogImporter(batch_size=3)
+        counts = importer.run(records)
+
+        self.assertEqual((counts['quiz'], counts['question'], counts['option'], counts['resource']), (1, 1, 1, 1))
+        self.assertEqual(len(importer.errors), 10)
+        self.assertEqual(Resource.objects.get().title, 'Limits video')
+        self.assertEqual(list(Keyword.objects.values_list('text', flat=True)), ['limits'])
+
+    def test_undecodable_lines_are_reported_and_skipped(self):
+        jsonl = io.StringIO(
+            '{"type": "keyword", "text": "limits"}\n'
+            '{"type": "keyword", "text": "broken"\n'
+            '\n'
+            '{"type": "keyword", "text": "series"}\n'
+        )
+        importer = CatalogImporter(batch_size=2)
+        counts = importer.run(read_records(jsonl, 'jsonl', importer.errors))
+
+        self.assertEqual(counts['keyword'], 2)
+        self.assertEqual(len(importer.errors), 1)
+        self.assertTrue(importer.errors[0].startswith('Line 2:'))
+
+        rows = io.StringIO(
+            'type,title,url,keywords\n'
+            'resource,Good,https://example.com/a,"[""limits""]"\n'
+            'resource,Bad,https://example.com/b,[limits\n'
+        )
+        importer = CatalogImporter(batch_size=1)
+        counts = importer.run(read_records(rows, 'csv', importer.errors))
+
+        self.assertEqual(counts['resource'], 1)
+        self.assertEqual(len(importer.errors), 1)
+        self.assertTrue(importer.errors[0].startswith('Line 3: keywords'))
+
+
+class AdaptiveScoringTests(TestCase):
+    def setUp(self):
+        isolate_keyword_index(self)
+        cache.clear()
+        self.user = User.objects.create_user('student', password='secret')
+        self.quiz = make_quiz(question_count=8)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def submit(self, answers):
+        return self.client.post('/api/submit-quiz/', {'quiz_id': self.quiz.id, 'answers': answers}, format='json')
+
+    def test_adaptive_attempt_is_scored_on_the_served_questions(self):
+        response = self.client.get('/api/get-questions/', {'quiz_id': self.quiz.id, 'adaptive': 'true', 'count': 2})
+        served = [q['id'] for q in response.data['questions']]
+        self.assertEqual(len(served), 2)
+
+        questions = Question.objects.in_bulk(served)
+        answers = [
+            {'question_id': q, 'selected_option_id': questions[q].options.get(is_correct=i == 0).id}
+            for i, q in enumerate(served)
+        ]
+        response = self.submit(answers)
+
+        self.assertEqual((response.data['score'], response.data['total_questions']), (50, 2))
+        self.assertTrue(UserQuizAttempt.objects.get().adaptive)
+
+    def serve(self, count, **params):
+        response = self.client.get('/api/get-questions/', {'quiz_id': self.quiz.id, 'count': count, **params})
+        return [q['id'] for q in response.data['questions']]
+
+    def answer(self, question_id, correct):
+        option = Option.objects.get(question_id=question_id, is_correct=correct)
+        return {'question_id': question_id, 'selected_option_id': option.id}
+
+    def test_omitted_and_unserved_questions_do_not_shrink_the_total(self):
+        served = self.serve(3, adaptive='true')
+        unserved = Question.objects.exclude(id__in=served).values_list('id', flat=True)[0]
+        response = self.submit([self.answer(served[0], True), self.answer(unserved, True)])
+
+        self.assertEqual((response.data['correct_answers'], response.data['total_questions']), (1, 3))
+        self.assertAlmostEqual(response.data['score'], 100 / 3)
+        self.assertEqual(list(UserAnswer.objects.values_list('question_id', flat=True)), [served[0]])
+
+    def test_duplicate_answers_count_once(self):
+        served = self.serve(2, adaptive='true')
+        response = self.submit([self.answer(served[0], True)] * 2 + [self.answer(served[1], True)] * 2)
+        self.assertEqual((response.data['score'], response.data['correct_answers']), (100, 2))
+
+        self.client.get('/api/get-questions/', {'quiz_id': make_quiz().id})
+        quiz = Quiz.objects.latest('id')
+        answers = answers_for(quiz, 1)[:1] * 4
+        response = self.client.post('/api/submit-quiz/', {'quiz_id': quiz.id, 'answers': answers}, format='json')
+        self.assertEqual((response.data['score'], response.data['total_questions']), (25, 4))
+
+    def test_served_questions_accumulate_and_the_attempt_stays_adaptive(self):
+        first = self.serve(2, adaptive='true')
+        answered = ','.join(f'{q}:1' for q in first)
+        second = self.serve(2, adaptive='true', answered=answered)
+        # A plain fetch can neither switch the mode back nor unserve anything
+        self.assertTrue(self.client.get('/api/get-questions/', {'quiz_id': self.quiz.id}).data['adaptive'])
+
+        self.assertTrue(UserQuizAttempt.objects.get().adaptive)
+        self.assertTrue(set(first + second) <= set(ServedQuestion.objects.values_list('question_id', flat=True)))
+        response = self.submit([self.answer(q, True) for q in first + second])
+        self.assertEqual(response.data['correct_answers'], 4)
+        self.assertEqual(response.data['total_questions'], ServedQuestion.objects.count())
+
+    def test_full_attempt_is_scored_on_the_whole_quiz(self):
+        self.client.get('/api/get-questions/', {'quiz_id': self.quiz.id})
+        response = self.submit(answers_for(self.quiz, 2)[:4])
+
+        self.assertEqual((response.data['score'], response.data['total_questions']), (25, 8))
+        self.assertFalse(UserQuizAttempt.objects.get().adaptive)
+
+
+class LearningProfileTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('student')
+        self.quiz = make_quiz()
+        self.attempt = UserQuizAttempt.objects.create(user=self.user, quiz=self.quiz, completed=True)
+        self.subject = str(self.quiz.subject_id)
+
+    def test_weights_halve_after_one_half_life(self):
+        UserLearningProfile.objects.create(
+            user=self.user, weak_keywords={'limits': 4.0, 'series': 1.0}, weak_subjects={self.subject: 0.5},
+            updated_at=django_timezone.now() - timedelta(days=profiles.half_life_days()),
+        )
+        weights = profiles.get_weak_keywords(self.user.id)
+        self.assertAlmostEqual(weights['limits'], 2.0, places=4)
+        self.assertAlmostEqual(weights['series'], 0.5, places=4)
+
+        profiles.record_graded_attempt(self.user.id, self.attempt, ['limits'], 0, 4, 0)
+        profile = UserLearningProfile.objects.get(user=self.user)
+        self.assertAlmostEqual(profile.weak_keywords['limits'], 3.0, places=4)
+        self.assertAlmostEqual(profile.weak_keywords['series'], 0.5, places=4)
+        self.assertAlmostEqual(profile.weak_subjects[self.subject], 0.25, places=4)
+
+    @override_settings(LEARNING_PROFILE_MAX_KEYWORDS=3)
+    def test_keyword_vector_is_capped_to_the_heaviest_terms(self):
+        UserLearningProfile.objects.create(user=self.user, weak_keywords={'limits': 5.0, 'series': 0.1})
+        profiles.record_graded_attempt(self.user.id, self.attempt, ['derivatives', 'integrals', 'vectors'], 3, 4, 0)
+
+        weak_keywords = UserLearningProfile.objects.get(user=self.user).weak_keywords
+        self.assertEqual(list(weak_keywords), ['limits', 'derivatives', 'integrals'])
+        self.assertAlmostEqual(weak_keywords['integrals'], 0.5)
+
+    def test_subject_ability_blends_each_attempt_into_the_estimate(self):
+        profiles.record_graded_attempt(self.user.id, self.attempt, [], 0, 4, 0)
+        first = math.log(4.5 / 0.5)
+        self.assertAlmostEqual(profiles.get_subject_ability(self.user.id, self.quiz.subject_id), first)
+
+        profiles.record_graded_attempt(self.user.id, self.attempt, [], 4, 4, 0)
+        weight = profiles.ability_update_weight()
+        self.assertAlmostEqual(
+            profiles.get_subject_ability(self.user.id, self.quiz.subject_id),
+            (1 - weight) * first + weight * math.log(0.5 / 4.5),
+        )
+        self.assertEqual(profiles.get_subject_ability(self.user.id, self.quiz.subject_id + 1), 0.0)
+        self.assertEqual(UserLearningProfile.objects.get(user=self.user).attempts_graded, 2)
+
+
+class RollupAndFeedbackTests(TestCase):
+    def setUp(self):
+        isolate_keyword_index(self)
+        cache.clear()
+        self.user = User.objects.create_user('student', password='secret')
+        self.quiz = make_quiz()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_rollup_failure_does_not_fail_the_graded_submission(self):
+        with mock.patch('quiz_app.rollups.record_graded_attempt', side_effect=RuntimeError('rollup table locked')):
+            response = self.client.post(
+                '/api/submit-quiz/', {'quiz_id': self.quiz.id, 'answers': answers_for(self.quiz, 3)}, format='json'
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(UserQuizAttempt.objects.get().completed)
+
+    def test_repeated_feedback_counts_each_flag_once(self):
+        recommendations = make_recommendations(self.user, self.quiz, 2)
+        UserLearningProfile.objects.create(user=self.user, recommendations_unviewed=2)
+        first, second = recommendations
+        events = [(first.id, 'click'), (first.id, 'view'), (second.id, 'dismiss')]
+
+        apply_feedback(self.user, events)
+        apply_feedback(self.user, events)
+
+        profile = UserLearningProfile.objects.get(user=self.user)
+        self.assertEqual((profile.recommendations_viewed, profile.recommendations_unviewed), (1, 1))
+        stat = ResourceStat.objects.get(resource=first.resource)
+        self.assertEqual((stat.viewed, stat.clicked, stat.dismissed), (1, 1, 0))
+        self.assertEqual(ResourceStat.objects.get(resource=second.resource).dismissed, 1)
+        self.assertEqual(RecommendationInteraction.objects.count(), 6)
+
+    def test_row_flipped_by_a_racing_batch_does_not_drop_the_others(self):
+        first, second = make_recommendations(self.user, self.quiz, 2)
+        UserLearningProfile.objects.create(user=self.user, recommendations_unviewed=2)
+        original_update = QuerySet.update
+        raced = []
+
+        def racing_update(queryset, **kwargs):
+            # Another batch views the second row after this one read the flags
+            if not raced:
+                raced.append(second.id)
+                UserRecommendation.objects.filter(id=second.id).update(viewed=True)
+            return original_update(queryset, **kwargs)
+
+        with mock.patch.object(QuerySet, 'update', autospec=True, side_effect=racing_update):
+            apply_feedback(self.user, [(first.id, 'view'), (second.id, 'view')])
+
+        self.assertEqual(ResourceStat.objects.get(resource=first.resource).viewed, 1)
+        self.assertFalse(ResourceStat.objects.filter(resource=second.resource, viewed__gt=0).exists())
+        self.assertEqual(UserLearningProfile.objects.get(user=self.user).recommendations_viewed, 1)
+
+    def test_stat_filters_reject_malformed_values(self):
+        self.client.force_authenticate(User.objects.create_superuser('admin', password='secret'))
+        for url, params in (
+            ('/api/analytics/quizzes/', {'since': 'yesterday'}),
+            ('/api/analytics/quizzes/', {'until': '2024-02-30'}),
+            ('/api/analytics/quizzes/', {'quiz_id': 'abc'}),
+            ('/api/analytics/questions/', {'quiz_id': 'abc'}),
+        ):
+            with self.subTest(url=url, params=params):
+                self.assertEqual(self.client.get(url, params).status_code, 400)
+        response = self.client.get('/api/analytics/quizzes/', {'quiz_id': self.quiz.id, 'since': '2024-01-01'})
+        self.assertEqual(response.status_code, 200)
+
+
+class LargeTableAdminTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', password='secret')
+        self.client.force_login(self.admin)
+
+    def add_rows(self, count):
+        for i in range(count):
+            user = User.objects.create_user(f'student{User.objects.count()}')
+            quiz = make_quiz(2)
+            make_recommendations(user, quiz, 2)
+            attempt = UserQuizAttempt.objects.get(user=user)
+            for question in quiz.questions.all():
+                UserAnswer.objects.create(
+                    attempt=attempt, question=question, selected_option=question.options.first(), is_correct=True
+                )
+
+    def test_changelist_query_count_does_not_grow_with_rows(self):
+        self.add_rows(10)
+        for url in (
+            '/admin/quiz_app/useranswer/', '/admin/quiz_app/useranswer/?is_correct__exact=1',
+            '/admin/quiz_app/userrecommendation/', '/admin/quiz_app/userrecommendation/?viewed__exact=0',
+            '/admin/quiz_app/userquizattempt/',
+        ):
+            # Session, user, the page's COUNT(*) and the page with its related rows joined in
+            with self.subTest(url=url), self.assertNumQueries(4):
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_estimated_count_is_only_read_on_postgresql(self):
+        self.add_rows(3)
+        queryset = UserAnswer.objects.order_by('-id')
+        self.assertEqual(EstimatedCountPaginator(queryset, 100).count, 6)
+
+        estimate = mock.MagicMock(vendor='postgresql')
+        estimate.cursor.return_value.__enter__.return_value.fetchone.return_value = (250000,)
+        with mock.patch('quiz_app.admin.connections', {'default': estimate}):
+            self.assertEqual(EstimatedCountPaginator(queryset, 100).count, 250000)
+            # Filtered lists and small tables are still counted exactly
+            self.assertEqual(EstimatedCountPaginator(queryset.filter(is_correct=False), 100).count, 0)
+            estimate.cursor.return_value.__enter__.return_value.fetchone.return_value = (12,)
+            self.assertEqual(EstimatedCountPaginator(queryset, 100).count, 6)
+
+
+class RecommendationFeedbackApiTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('student', password='secret')
+        self.other = User.objects.create_user('other', password='secret')
+        quiz = make_quiz()
+        self.mine = make_recommendations(self.user, quiz, 2)
+        self.theirs = make_recommendations(self.other, quiz, 1)[0]
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def post_events(self, events):
+        return self.client.post('/api/recommendation-feedback/', {'events': events}, format='json')
+
+    def test_batch_reports_applied_and_ignored_events(self):
+        first, second = self.mine
+        response = self.post_events([
+            {'recommendation_id': first.id, 'event': 'click'},
+            {'recommendation_id': second.id, 'event': 'dismiss'},
+            {'recommendation_id': self.theirs.id, 'event': 'view'},
+            {'recommendation_id': 999999, 'event': 'view'},
+        ])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['applied'], 2)
+        self.assertEqual(response.data['ignored'], sorted([self.theirs.id, 999999]))
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.theirs.refresh_from_db()
+        self.assertEqual((first.viewed, first.clicked, second.dismissed), (True, True, True))
+        self.assertFalse(self.theirs.viewed)
+
+    def test_empty_oversized_and_malformed_batches_are_rejected(self):
+        event = {'recommendation_id': self.mine[0].id, 'event': 'view'}
+        for events in ([], [event] * 501, [{'recommendation_id': self.mine[0].id, 'event': 'like'}]):
+            with self.subTest(size=len(events)):
+                self.assertEqual(self.post_events(events).status_code, 400)
+        self.assertEqual(self.post_events([event] * 500).status_code, 200)
+        self.assertFalse(UserRecommendation.objects.filter(viewed=True).exclude(id=self.mine[0].id).exists())
+
+    def test_marking_another_users_recommendation_viewed_is_not_found(self):
+        response = self.client.post(f'/api/mark-recommendation-viewed/{self.theirs.id}/')
+        self.assertEqual(response.status_code, 404)
+        self.theirs.refresh_from_db()
+        self.assertFalse(self.theirs.viewed)
+
+        response = self.client.post(f'/api/mark-recommendation-viewed/{self.mine[0].id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(UserRecommendation.objects.get(id=self.mine[0].id).viewed)
+
+
+class SideloadedRecommendationTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user('student', password='secret')
+        attempt = UserQuizAttempt.objects.create(user=user, quiz=make_quiz(1), completed=True)
+        resource = Resource.objects.create(
+            title='Limits', description='Long description', url='https://example.com/limits',
+            resource_type=ResourceType.objects.create(name='Article'), rating=4.0,
+        )
+        UserRecommendation.objects.create(user=user, resource=resource, quiz_attempt=attempt, relevance_score=1.0)
+        self.recommendations = UserRecommendation.objects.select_related('resource')
+        self.resource = resource
+
+    def test_fields_without_resource_sideload_nothing(self):
+        data, resources = serialize_recommendations(self.recommendations, ['id'], sideload=True)
+        self.assertEqual(resources, [])
+        self.assertEqual(list(data[0]), ['id'])
+
+    def test_dotted_resource_fields_are_sparse_and_joinable(self):
+        data, resources = serialize_recommendations(self.recommendations, ['id', 'resource.title'], sideload=True)
+        self.assertEqual(data[0]['resource'], self.resource.id)
+        self.assertEqual(resources, [{'id': self.resource.id, 'title': 'Limits'}])
+
+    def test_bare_resource_field_sideloads_whole_resources(self):
+        data, resources = serialize_recommendations(self.recommendations, ['id', 'resource'], sideload=True)
+        self.assertEqual(data[0]['resource'], self.resource.id)
+        self.assertIn('description', resources[0])
+
+
+class ResponseEncodingTests(TestCase):
+    def setUp(self):
+        for i in range(20):
+            Subject.objects.create(name=f'Subject {i}', description='Limits, series and derivatives')
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('student', password='secret'))
+
+    def get(self, url, accept_encoding):
+        return self.client.get(url, HTTP_ACCEPT_ENCODING=accept_encoding)
+
+    @skipUnless(brotli, 'brotli is not installed')
+    def test_json_is_brotli_compressed_only_when_accepted(self):
+        plain = self.get('/api/subjects/', '')
+        self.assertFalse(plain.has_header('Content-Encoding'))
+        self.assertIn('Accept-Encoding', plain['Vary'])
+
+        for accept_encoding in ('br', 'gzip, deflate, br', 'br;q=1.0, gzip;q=0.5'):
+            with self.subTest(accept_encoding=accept_encoding):
+                response = self.get('/api/subjects/', accept_encoding)
+                self.assertEqual(response['Content-Encoding'], 'br')
+                self.assertEqual(brotli.decompress(response.content), plain.content)
+                self.assertEqual(int(response['Content-Length']), len(response.content))
+
+        response = self.get('/api/subjects/', 'gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+
+    def test_html_is_left_to_gzip_and_its_breach_padding(self):
+        for url in ('/api/subjects/', '/admin/login/'):
+            with self.subTest(url=url):
+                response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, br', HTTP_ACCEPT='text/html')
+                self.assertEqual(response['Content-Type'].split(';')[0], 'text/html')
+                self.assertEqual(response['Content-Encoding'], 'gzip')
+
+    @skipUnless(orjson, 'orjson is not installed')
+    def test_orjson_output_matches_json_renderer(self):
+        data = {
+            'text': 'Limites – séries \u2028 next line \u2029 “quoted” \\ "\n',
+            'numbers': [0, -1, 2 ** 40, 1.5, 0.1, 0.0001, 0.123456789, 12345678.9, True, False, None],
+            'created_at': datetime(2024, 5, 1, 12, 30, 15, 123456, tzinfo=dt_timezone.utc),
+            'naive': datetime(2024, 5, 1, 12, 30),
+            'day': datetime(2024, 5, 1).date(),
+            'rating': Decimal('4.50'),
+            'label': gettext_lazy('Limits'),
+            'nested': {'empty': {}, 'list': [], 'tuple': (1, 2)},
+            1: 'integer key',
+        }
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+        # Only the spelling of exponent-range floats differs
+        tiny_and_huge = [1e-07, 1.5e-05, 1e16, 1.2345e20]
+        self.assertEqual(
+            json.loads(ORJSONRenderer().render(tiny_and_huge)), json.loads(JSONRenderer().render(tiny_and_huge))
+        )
+
+        attempt = UserQuizAttempt.objects.create(
+            user=User.objects.get(), quiz=make_quiz(1), completed=True, completed_at=django_timezone.now()
+        )
+        UserRecommendation.objects.create(
+            user=attempt.user, quiz_attempt=attempt, relevance_score=0.123456789,
+            resource=Resource.objects.create(
+                title='Limits', description='Long description', url='https://example.com/limits',
+                resource_type=ResourceType.objects.create(name='Article'), rating=4.5,
+            ),
+        )
+        for sideload in (False, True):
+            data = serialize_recommendations(UserRecommendation.objects.all(), None, sideload)
+            self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+
+
+class ResourceFilterParamsTests(TestCase):
+    def setUp(self):
+        self.article = ResourceType.objects.create(name='Article')
+
+    def test_no_params_means_no_filter(self):
+        self.assertIsNone(ResourceFilter.from_query_params({}))
+
+    def test_types_by_id_or_name(self):
+        resource_filter = ResourceFilter.from_query_params({'resource_type': f'article,{self.article.id + 1}'})
+        self.assertEqual(sorted(resource_filter.resource_types), [self.article.id, self.article.id + 1])
+        self.assertEqual(ResourceFilter.from_query_params({'resource_type': 'podcast'}).resource_types, [0])
+
+    def test_malformed_values_raise_value_error(self):
+        for params in (
+            {'min_rating': 'high'}, {'min_rating': 'nan'}, {'max_age_days': 'inf'},
+            {'max_age_days': '-1'}, {'resource_type': '99999999999999999999'},
+        ):
+            with self.subTest(params=params), self.assertRaises(ValueError):
+                ResourceFilter.from_query_params(params)
+
+    def test_age_beyond_any_date_means_no_age_limit(self):
+        for max_age_days in ('1000000', '1e10'):
+            resource_filter = ResourceFilter.from_query_params({'max_age_days': max_age_days, 'min_rating': '1'})
+            self.assertIsNone(resource_filter.created_after)
+
+    def test_views_answer_bad_filters_with_400(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user('student', password='secret'))
+        self.assertEqual(client.get('/api/get-recommendations/', {'max_age_days': 'inf'}).status_code, 400)
+        self.assertEqual(client.get('/api/get-recommendations/', {'max_age_days': '1e10'}).status_code, 200)
+
+
+class ShadowEvaluationTests(TestCase):
+    def setUp(self):
+        isolate_keyword_index(self)
+        cache.clear()
+        self.user = User.objects.create_user('student', password='secret')
+        self.quiz = make_quiz()
+        UserLearningProfile.objects.create(user=self.user, weak_keywords={'derivatives': 2.0})
+
+    @override_settings(RECOMMENDATION_SHADOW_ENGINE='tfidf-cf-2', RECOMMENDATION_SHADOW_SAMPLE_RATE=1.0)
+    def test_shadow_ranks_with_the_primarys_profile_weights(self):
+        ranked_with = {}
+        original_rank = RecommendationEngine.rank
+
+        def recording_rank(engine, user_id, quiz_attempt_id, resource_filter=None, term_weights=None):
+            ranked_with[engine.version] = term_weights
+            return original_rank(engine, user_id, quiz_attempt_id, resource_filter, term_weights)
+
+        executor = mock.Mock()
+        executor.submit.side_effect = lambda fn, *args: fn(*args)
+        client = APIClient()
+        client.force_authenticate(self.user)
+        with mock.patch.object(RecommendationEngine, 'rank', autospec=True, side_effect=recording_rank), \
+                mock.patch('quiz_app.shadow.get_executor', return_value=executor):
+            response = client.post(
+                '/api/submit-quiz/', {'quiz_id': self.quiz.id, 'answers': answers_for(self.quiz, 1)}, format='json'
+            )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(ranked_with), {'tfidf-cf-1', 'tfidf-cf-2'})
+        self.assertEqual(ranked_with['tfidf-cf-2'], ranked_with['tfidf-cf-1'])
+        self.assertEqual(list(ranked_with['tfidf-cf-1']), ['derivatives'])
+        # The primary's attempt has been folded into the profile since
+        self.assertIn('question', UserLearningProfile.objects.get(user=self.user).weak_keywords)
+
+
+class FakeEngine:
+    """Deterministic stand-in for a ranking engine, echoing what it was asked"""
+
+    def rank(self, user_id, quiz_attempt_id, resource_filter=None, term_weights=None):
+        if user_id < 0:
+            raise RuntimeError('no such user')
+        keywords = sorted(term_weights or ())
+        if resource_filter is not None:
+            keywords.append(f'min_rating={resource_filter.min_rating}')
+        return [(user_id * 10, 1.0), (quiz_attempt_id, 0.5)], keywords, 2
+
+
+class FakeScoringService:
+    """Serves score_requests on a real Unix socket, recording each batch size"""
+
+    def __init__(self, test, respond=True):
+        self.respond = respond
+        self.batch_sizes = []
+        directory = tempfile.TemporaryDirectory()
+        test.addCleanup(directory.cleanup)
+        self.address = f'unix:{directory.name}/scoring.sock'
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(self.address[len('unix:'):])
+        self.sock.listen(16)
+        test.addCleanup(self.sock.close)
+        threading.Thread(target=self.serve, daemon=True).start()
+
+    def serve(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            with conn:
+                message = recv_frame(conn)
+                self.batch_sizes.append(len(message['requests']))
+                if self.respond:
+                    send_frame(conn, {'results': score_requests(message['requests'])})
+                else:
+                    time.sleep(1)
+
+
+class ScoringServiceTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch('quiz_app.scoring.get_engine', return_value=FakeEngine())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_frames_round_trip_over_a_socket_pair(self):
+        left, right = socket.socketpair()
+        with left, right:
+            send_frame(left, {'requests': [{'id': 1}]})
+            send_frame(left, {'results': []})
+            self.assertEqual(recv_frame(right), {'requests': [{'id': 1}]})
+            self.assertEqual(recv_frame(right), {'results': []})
+            left.close()
+            self.assertIsNone(recv_frame(right))
+
+    def test_oversized_and_truncated_frames_are_rejected(self):
+        left, right = socket.socketpair()
+        with left, right:
+            left.sendall((MAX_FRAME + 1).to_bytes(4, 'big'))
+            with self.assertRaises(ValueError):
+                recv_frame(right)
+        left, right = socket.socketpair()
+        with left, right:
+            left.sendall((100).to_bytes(4, 'big') + b'{"requests"')
+            left.close()
+            with self.assertRaises(ConnectionError):
+                recv_frame(right)
+
+    def test_filter_survives_the_json_round_trip(self):
+        resource_filter = ResourceFilter([3, 5], 2.5, datetime(2024, 5, 1, 12, 30, tzinfo=dt_timezone.utc))
+        restored = ResourceFilter.from_dict(json.loads(json.dumps(resource_filter.to_dict())))
+        self.assertEqual(restored.resource_types, [3, 5])
+        self.assertEqual(restored.min_rating, 2.5)
+        self.assertEqual(restored.created_after, resource_filter.created_after)
+        restored = ResourceFilter.from_dict(json.loads(json.dumps(ResourceFilter().to_dict())))
+        self.assertEqual((restored.resource_types, restored.min_rating, restored.created_after), (None, None, None))
+
+    def test_concurrent_calls_share_a_round_trip_and_match_in_process_ranking(self):
+        service = FakeScoringService(self)
+        client = ScoringClient(service.address, max_batch=8, max_wait=0.3, connections=1, timeout=5)
+        resource_filter = ResourceFilter(min_rating=3.0)
+        results = {}
+
+        def call(user_id):
+            results[user_id] = client.rank('tfidf-cf-1', user_id, 7, resource_filter, {'limits': 1.0})
+
+        threads = [threading.Thread(target=call, args=(user_id,)) for user_id in range(1, 6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sum(service.batch_sizes), 5)
+        self.assertLess(len(service.batch_sizes), 5)
+        for user_id, result in results.items():
+            self.assertEqual(
+                result, InProcessScoring().rank('tfidf-cf-1', user_id, 7, resource_filter, {'limits': 1.0})
+            )
+
+    def test_engine_errors_are_raised_as_scoring_errors(self):
+        service = FakeScoringService(self)
+        client = ScoringClient(service.address, max_wait=0, connections=1, timeout=5)
+        with self.assertRaisesRegex(ScoringError, 'no such user'):
+            client.rank('tfidf-cf-1', -1, 7)
+
+    def test_unreachable_service_falls_back_to_in_process_ranking(self):
+        client = ScoringClient('unix:/nonexistent/scoring.sock', max_wait=0, connections=1, timeout=5)
+        with self.assertLogs('quiz_app.scoring', 'WARNING'):
+            self.assertEqual(client.rank('tfidf-cf-1', 2, 7), InProcessScoring().rank('tfidf-cf-1', 2, 7))
+
+    def test_slow_service_falls_back_to_in_process_ranking(self):
+        service = FakeScoringService(self, respond=False)
+        client = ScoringClient(service.address, max_wait=0, connections=1, timeout=0.2)
+        started = time.monotonic()
+        with self.assertLogs('quiz_app.scoring', 'WARNING'):
+            self.assertEqual(client.rank('tfidf-cf-1', 2, 7), InProcessScoring().rank('tfidf-cf-1', 2, 7))
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual(service.batch_sizes, [1])
@@ -5,6 +5,9 @@ from . import views
 router = DefaultRouter()
 router.register(r'subjects', views.SubjectViewSet)
 router.register(r'quizzes', views.QuizViewSet, basename='quiz')
+router.register(r'analytics/quizzes', views.QuizDailyStatViewSet, basename='quiz-daily-stat')
+router.register(r'analytics/questions', views.QuestionStatViewSet, basename='question-stat')
+router.register(r'analytics/resources', views.ResourceStatViewSet, basename='resource-stat')
 
 urlpatterns = [
     path('', include(router.urls)),
@@ -13,6 +16,7 @@ urlpatterns = [
     path('get-quizzes/', views.get_quizzes, name='get-quizzes'),
     path('get-recommendations/', views.get_recommendations, name='get-recommendations'),
     path('mark-recommendation-viewed/<int:recommendation_id>/', views.mark_recommendation_viewed, name='mark-recommendation-viewed'),
+    path('recommendation-feedback/', views.recommendation_feedback, name='recommendation-feedback'),
     path('register/', views.UserRegistrationView.as_view(), name='user-register'),
     path('profile/', views.UserProfileView.as_view(), name='user-profile'),
 ]
\ No newline at end of file
@@ -1,15 +1,32 @@
+import hashlib
+import json
 from rest_framework import viewsets, status, generics
-from rest_framework.decorators import api_view, permission_classes
-from django.http import JsonResponse
+from rest_framework.decorators import api_view, permission_classes, throttle_classes
+from django.http import Http404, JsonResponse
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
+from django.utils.dateparse import parse_date
 from rest_framework.views import APIView
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import AllowAny
+from rest_framework.throttling import UserRateThrottle
+from django.db import transaction
 from .models import *
 from .serializers import *
-from .recommendation import RecommendationEngine
+from .recommendation import get_engine
+from .shadow import maybe_run_shadow
+from .scoring import get_scoring_client
+from .keyword_index import ResourceFilter
+from .coalescing import RequestCoalescer, RequestInProgress
+from .feedback import apply_feedback
+from .adaptive import get_calibration_table
+from . import profiles, rollups
+from django.conf import settings
+import logging
+
+logger = logging.getLogger(__name__)
 
 class UserRegistrationView(APIView):
     permission_classes = [AllowAny]
@@ -38,6 +55,58 @@ class QuizViewSet(viewsets.ReadOnlyModelViewSet):
             queryset = queryset.filter(subject_id=subject_id)
         return queryset
 
+def stat_filter_params(params, date_names=()):
+    """Parsed quiz_id and date filters of a stats request; malformed values are a 400"""
+    parsed = {}
+    if params.get('quiz_id'):
+        try:
+            parsed['quiz_id'] = int(params['quiz_id'])
+        except ValueError:
+            raise ValidationError({'quiz_id': 'Must be an integer'})
+    for name in date_names:
+        if params.get(name):
+            try:
+                parsed[name] = parse_date(params[name])
+            except ValueError:
+                parsed[name] = None
+            if parsed[name] is None:
+                raise ValidationError({name: 'Must be a date as YYYY-MM-DD'})
+    return parsed
+
+class QuizDailyStatViewSet(viewsets.ReadOnlyModelViewSet):
+    """Per-quiz, per-day attempt rollups; filter with quiz_id, since and until (YYYY-MM-DD)"""
+    serializer_class = QuizDailyStatSerializer
+    permission_classes = [IsAdminUser]
+    
+    def get_queryset(self):
+        queryset = QuizDailyStat.objects.order_by('-date', 'quiz_id')
+        params = stat_filter_params(self.request.query_params, ('since', 'until'))
+        if 'quiz_id' in params:
+            queryset = queryset.filter(quiz_id=params['quiz_id'])
+        if 'since' in params:
+            queryset = queryset.filter(date__gte=params['since'])
+        if 'until' in params:
+            queryset = queryset.filter(date__lte=params['until'])
+        return queryset
+
+class QuestionStatViewSet(viewsets.ReadOnlyModelViewSet):
+    """Per-question answer rollups; filter with quiz_id"""
+    serializer_class = QuestionStatSerializer
+    permission_classes = [IsAdminUser]
+    
+    def get_queryset(self):
+        queryset = QuestionStat.objects.select_related('question').order_by('question_id')
+        params = stat_filter_params(self.request.query_params)
+        if 'quiz_id' in params:
+            queryset = queryset.filter(question__quiz_id=params['quiz_id'])
+        return queryset
+
+class ResourceStatViewSet(viewsets.ReadOnlyModelViewSet):
+    """Per-resource recommendation and feedback rollups"""
+    queryset = ResourceStat.objects.order_by('-recommended')
+    serializer_class = ResourceStatSerializer
+    permission_classes = [IsAdminUser]
+
 class UserProfileView(generics.RetrieveUpdateAPIView):
     serializer_class = UserSerializer
     permission_classes = [IsAuthenticated]
@@ -76,18 +145,25 @@ def get_questions(request):
     quiz = get_object_or_404(Quiz, id=quiz_id)
     questions = Question.objects.filter(quiz=quiz)
 
+    adaptive = request.query_params.get('adaptive') in ('1', 'true')
+
     # Create or get user attempt
     attempt, created = UserQuizAttempt.objects.get_or_create(
         user=request.user,
         quiz=quiz,
-        defaults={'started_at': timezone.now()}
+        defaults={'started_at': timezone.now(), 'adaptive': adaptive}
     )
     
     # If attempt already exists but is not completed, update started_at
     if not created and not attempt.completed:
         attempt.started_at = timezone.now()
+        # Scored on what it was served, so once adaptive an attempt stays adaptive
+        attempt.adaptive = attempt.adaptive or adaptive
         attempt.save()
     
+    if adaptive or attempt.adaptive:
+        return adaptive_questions(request, quiz, attempt)
+    
     serializer = QuestionSerializer(questions, many=True)
     
     return Response({
@@ -97,10 +173,73 @@ def get_questions(request):
         'questions': serializer.data
     })
 
+def adaptive_questions(request, quiz, attempt):
+    """Pick the next most informative questions for the student's current ability
+
+    `answered` lists responses given so far in this session as
+    `question_id:1` (correct) or `question_id:0`; they refine the ability
+    estimate and are never asked again.
+    """
+    try:
+        count = int(request.query_params.get('count', settings.ADAPTIVE_QUESTION_COUNT))
+        answered = []
+        for item in request.query_params.get('answered', '').split(','):
+            if item:
+                question_id, correct = map(int, item.split(':'))
+                answered.append((question_id, bool(correct)))
+    except ValueError:
+        return Response(
+            {"error": "count must be an integer and answered a list of question_id:0|1"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    table = get_calibration_table(quiz.id)
+    ability = profiles.get_subject_ability(request.user.id, quiz.subject_id)
+    ability = table.update_ability(ability, answered)
+    question_ids = table.select(ability, count, exclude=[q for q, _ in answered])
+    
+    if attempt.adaptive and not attempt.completed:
+        ServedQuestion.objects.bulk_create(
+            [ServedQuestion(attempt=attempt, question_id=q) for q in question_ids], ignore_conflicts=True
+        )
+    
+    questions = {q.id: q for q in Question.objects.filter(id__in=question_ids).prefetch_related('options')}
+    serializer = QuestionSerializer([questions[q] for q in question_ids if q in questions], many=True)
+    
+    return Response({
+        'quiz_id': quiz.id,
+        'quiz_title': quiz.title,
+        'attempt_id': attempt.id,
+        'adaptive': True,
+        'ability': ability,
+        'questions': serializer.data
+    })
+
+class SubmitQuizThrottle(UserRateThrottle):
+    scope = 'submit_quiz'
+
+submit_quiz_coalescer = RequestCoalescer('submit_quiz')
+
+def submission_key(request, quiz_id, submitted_answers):
+    """Idempotency key for a submission: the client's header, or a digest of the answers and filters"""
+    idempotency_key = request.headers.get('Idempotency-Key')
+    if not idempotency_key:
+        answers = sorted((a['question_id'], a['selected_option_id']) for a in submitted_answers)
+        filters = [request.query_params.get(name, '') for name in ResourceFilter.PARAMS]
+        idempotency_key = hashlib.sha256(json.dumps([answers, filters]).encode()).hexdigest()
+    # Scoped per user and quiz, i.e. per attempt
+    return f"{request.user.id}:{quiz_id}:{idempotency_key}"
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@throttle_classes([SubmitQuizThrottle])
 def submit_quiz(request):
-    """Submit quiz answers and get recommendations"""
+    """Submit quiz answers and get recommendations
+
+    Retries and concurrent duplicates of the same submission share one
+    grading run: in-flight duplicates wait for it and later retries get
+    the stored response replayed.
+    """
     serializer = QuizSubmissionSerializer(data=request.data)
     
     if not serializer.is_valid():
@@ -108,7 +247,38 @@ def submit_quiz(request):
     
     quiz_id = serializer.validated_data['quiz_id']
     submitted_answers = serializer.validated_data['answers']
-    
+    try:
+        resource_filter = ResourceFilter.from_query_params(request.query_params)
+    except ValueError:
+        return Response({"error": "Invalid resource filter"}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        (status_code, data), replayed = submit_quiz_coalescer.run(
+            submission_key(request, quiz_id, submitted_answers),
+            lambda: grade_submission(request.user, quiz_id, submitted_answers, resource_filter),
+            should_store=lambda result: result[0] == status.HTTP_200_OK,
+        )
+    except RequestInProgress:
+        response = Response(
+            {"error": "This submission is still being processed, retry shortly"},
+            status=status.HTTP_409_CONFLICT,
+        )
+        response['Retry-After'] = '1'
+        return response
+    if status_code == status.HTTP_200_OK:
+        # Shaped per request, so retries may ask for different fields than the first call
+        data = dict(data)
+        recommendations = recommendation_queryset(request.user).filter(
+            quiz_attempt_id=data['attempt_id']
+        ).order_by('-relevance_score')
+        add_recommendations(request, data, recommendations)
+    response = Response(data, status=status_code)
+    if replayed:
+        response['Idempotent-Replayed'] = 'true'
+    return response
+
+def grade_submission(user, quiz_id, submitted_answers, resource_filter=None):
+    """Grade a submission and generate recommendations, returning (status, data)"""
     quiz = get_object_or_404(Quiz, id=quiz_id)
     
     # Get all questions in the quiz
@@ -117,124 +287,174 @@ def submit_quiz(request):
     
     # Get or create user attempt
     attempt, _ = UserQuizAttempt.objects.get_or_create(
-        user=request.user,
+        user=user,
         quiz=quiz,
         defaults={'started_at': timezone.now()}
     )
+
+    with transaction.atomic():
+        # Lock the attempt so racing submissions grade it one at a time
+        attempt = UserQuizAttempt.objects.select_for_update().get(id=attempt.id)
+
+        # If attempt is already completed, return error
+        if attempt.completed:
+            return status.HTTP_400_BAD_REQUEST, {"error": "This quiz has already been completed"}
+
+        # One answer per question, the last one sent
+        answers = {a['question_id']: a for a in submitted_answers}
+        if attempt.adaptive:
+            # Only the served subset was asked: score against it and drop answers to anything else
+            served = set(attempt.served_questions.values_list('question_id', flat=True))
+            total_questions = len(served)
+            answers = {q: a for q, a in answers.items() if q in served}
+
+        # Clear previous answers if any
+        UserAnswer.objects.filter(attempt=attempt).delete()
     
-    # If attempt is already completed, return error
-    if attempt.completed:
-        return Response(
-            {"error": "This quiz has already been completed"}, 
-            status=status.HTTP_400_BAD_REQUEST
-        )
-    
-    # Clear previous answers if any
-    UserAnswer.objects.filter(attempt=attempt).delete()
-    
-    # Process answers
-    correct_answers = 0
+        # Process answers
+        correct_answers = 0
     
-    # Process all questions in the quiz
-    for answer_data in submitted_answers:
-        question_id = answer_data['question_id']
-        selected_option_id = answer_data['selected_option_id']
+        # Process all questions in the quiz
+        for answer_data in answers.values():
+            question_id = answer_data['question_id']
+            selected_option_id = answer_data['selected_option_id']
         
-        question = get_object_or_404(Question, id=question_id, quiz=quiz)
+            question = get_object_or_404(Question, id=question_id, quiz=quiz)
         
-        # Check if this is an unanswered question (option_id = -1)
-        if selected_option_id == -1:
-            # Find an incorrect option to use
-            incorrect_option = Option.objects.filter(question=question, is_correct=False).first()
+            # Check if this is an unanswered question (option_id = -1)
+            if selected_option_id == -1:
+                # Find an incorrect option to use
+                incorrect_option = Option.objects.filter(question=question, is_correct=False).first()
             
-            # If no incorrect option found, use any option
-            if not incorrect_option:
-                incorrect_option = Option.objects.filter(question=question).first()
+                # If no incorrect option found, use any option
+                if not incorrect_option:
+                    incorrect_option = Option.objects.filter(question=question).first()
             
-            # Create answer record with is_correct explicitly set to false
-            UserAnswer.objects.create(
-                attempt=attempt,
-                question=question,
-                selected_option=incorrect_option,
-                is_correct=False  # Explicitly mark as incorrect
-            )
-        else:
-            # Normal case: user selected an option
-            selected_option = get_object_or_404(Option, id=selected_option_id, question=question)
-            is_correct = selected_option.is_correct
+                # Create answer record with is_correct explicitly set to false
+                UserAnswer.objects.create(
+                    attempt=attempt,
+                    question=question,
+                    selected_option=incorrect_option,
+                    is_correct=False  # Explicitly mark as incorrect
+                )
+            else:
+                # Normal case: user selected an option
+                selected_option = get_object_or_404(Option, id=selected_option_id, question=question)
+                is_correct = selected_option.is_correct
             
-            # Count correct answers
-            if is_correct:
-                correct_answers += 1
+                # Count correct answers
+                if is_correct:
+                    correct_answers += 1
             
-            # Save user answer
-            UserAnswer.objects.create(
-                attempt=attempt,
-                question=question,
-                selected_option=selected_option,
-                is_correct=is_correct
-            )
+                # Save user answer
+                UserAnswer.objects.create(
+                    attempt=attempt,
+                    question=question,
+                    selected_option=selected_option,
+                    is_correct=is_correct
+                )
     
-    # Update attempt
-    score_percentage = (correct_answers / total_questions) * 100 if total_questions > 0 else 0
-    attempt.score = score_percentage
-    attempt.completed = True
-    attempt.completed_at = timezone.now()
-    attempt.save()
+        # Update attempt
+        score_percentage = (correct_answers / total_questions) * 100 if total_questions > 0 else 0
+        attempt.score = score_percentage
+        attempt.completed = True
+        attempt.completed_at = timezone.now()
+        attempt.save()
     
     # Generate recommendations
-    recommendation_engine = RecommendationEngine()
-    recommendation_engine.generate_recommendations(request.user.id, attempt.id)
+    # Ranked by the scoring service when one is configured; saving stays here
+    recommendation_engine = get_engine()
+    recommendations = recommendation_engine.generate_recommendations(
+        user.id, attempt.id, resource_filter,
+        ranker=get_scoring_client().ranker(recommendation_engine.version),
+    )
     
-    # Get recommendations
-    recommendations = UserRecommendation.objects.filter(
-        user=request.user,
-        quiz_attempt=attempt
-    ).order_by('-relevance_score')
+    # Sampled attempts are ranked again by the candidate engine, off the request path
+    maybe_run_shadow(
+        user.id, attempt.id, recommendation_engine.version,
+        [r.resource_id for r in recommendations], recommendation_engine.last_rank_ms, resource_filter,
+        recommendation_engine.last_term_weights,
+    )
     
-    recommendation_serializer = UserRecommendationSerializer(recommendations, many=True)
+    # Keep reporting off the raw answer and recommendation tables. The attempt is
+    # already committed, so a failure here must not fail the request (retries
+    # would only see "already completed"); rebuild_rollups repairs the counts.
+    try:
+        rollups.record_graded_attempt(attempt)
+    except Exception as e:
+        logger.error(f"Error updating rollups for attempt {attempt.id}: {e}")
     
-    return Response({
+    return status.HTTP_200_OK, {
+        'attempt_id': attempt.id,
         'score': score_percentage,
         'correct_answers': correct_answers,
         'total_questions': total_questions,
         'completed_at': attempt.completed_at,
-        'recommendations': recommendation_serializer.data
-    })
+    }
+
+def recommendation_queryset(user):
+    return UserRecommendation.objects.filter(user=user).select_related('resource').prefetch_related('resource__keywords')
+
+def add_recommendations(request, data, recommendations):
+    """Put serialized recommendations into `data`, honouring ?fields= and ?shape=sideload"""
+    fields = request.query_params.get('fields')
+    fields = [f.strip() for f in fields.split(',') if f.strip()] if fields else None
+    sideload = request.query_params.get('shape') == 'sideload'
+    data['recommendations'], resources = serialize_recommendations(recommendations, fields, sideload)
+    if sideload:
+        data['resources'] = resources
+    return data
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_recommendations(request):
-    """Get recommendations for a user"""
+    """Get recommendations for a user, optionally filtered by resource type, rating and age"""
     quiz_attempt_id = request.query_params.get('quiz_attempt_id', None)
+    try:
+        resource_filter = ResourceFilter.from_query_params(request.query_params)
+    except ValueError:
+        return Response({"error": "Invalid resource filter"}, status=status.HTTP_400_BAD_REQUEST)
     
     if quiz_attempt_id:
-        recommendations = UserRecommendation.objects.filter(
-            user=request.user,
+        recommendations = recommendation_queryset(request.user).filter(
             quiz_attempt_id=quiz_attempt_id
         ).order_by('-relevance_score')
     else:
         # Get latest recommendations if no quiz_attempt_id specified
-        recommendations = UserRecommendation.objects.filter(
-            user=request.user
-        ).order_by('-created_at')
+        recommendations = recommendation_queryset(request.user).order_by('-created_at')
+    if resource_filter is not None:
+        recommendations = recommendations.filter(resource_filter.as_q('resource__'))
     
-    serializer = UserRecommendationSerializer(recommendations, many=True)
-    
-    return Response(serializer.data)
+    data = add_recommendations(request, {}, recommendations)
+    if 'resources' in data:
+        return Response(data)
+    return Response(data['recommendations'])
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def mark_recommendation_viewed(request, recommendation_id):
     """Mark a recommendation as viewed"""
-    recommendation = get_object_or_404(
-        UserRecommendation, 
-        id=recommendation_id,
-        user=request.user
-    )
+    ignored = apply_feedback(request.user, [(recommendation_id, 'view')])
+    if ignored:
+        raise Http404
     
-    recommendation.viewed = True
-    recommendation.save()
+    return Response({'status': 'success'})
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def recommendation_feedback(request):
+    """Apply a batch of view, click and dismiss events to the user's recommendations"""
+    serializer = RecommendationFeedbackSerializer(data=request.data)
     
-    return Response({'status': 'success'})
\ No newline at end of file
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    events = [(e['recommendation_id'], e['event']) for e in serializer.validated_data['events']]
+    ignored = apply_feedback(request.user, events)
+    
+    return Response({
+        'status': 'success',
+        'applied': len(events) - sum(1 for recommendation_id, _ in events if recommendation_id in ignored),
+        'ignored': ignored
+    })
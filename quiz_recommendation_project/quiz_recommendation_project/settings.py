@@ -49,6 +49,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'django.middleware.gzip.GZipMiddleware',
+    'quiz_app.middleware.BrotliMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -140,8 +142,26 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'quiz_app.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_THROTTLE_RATES': {
+        'submit_quiz': '30/min',
+    },
 }
 
+# Shared store for idempotent request replay and cross-worker coalescing.
+# Point this at Redis or Memcached when running more than one process.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+REQUEST_REPLAY_TTL = 300  # seconds a finished submit_quiz response is replayed to retries
+REQUEST_COALESCE_TIMEOUT = 30  # seconds a duplicate waits on the in-flight request
+
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
@@ -158,4 +178,36 @@ SIMPLE_JWT = {
     'USER_ID_CLAIM': 'user_id',
     'AUTH_TOKEN_CLASSES': ('rest_framework_simplejwt.tokens.AccessToken',),
     'TOKEN_TYPE_CLAIM': 'token_type',
-}
\ No newline at end of file
+}
+
+# Recommendation index snapshots, written by `manage.py build_index` and
+# memory-mapped by every worker
+RECOMMENDATION_INDEX_DIR = BASE_DIR / 'recommendation_index'
+RECOMMENDATION_INDEX_CHECK_INTERVAL = 5  # seconds between checks for a newer snapshot
+
+# Per-user learning profile maintained on every graded attempt
+LEARNING_PROFILE_HALF_LIFE_DAYS = 30  # weak-area weights halve after this many days
+LEARNING_PROFILE_MAX_KEYWORDS = 50  # size cap of the sparse weak-keyword vector
+LEARNING_PROFILE_QUERY_WEIGHT = 0.5  # weight of the strongest profile keyword relative to the attempt's own
+LEARNING_PROFILE_ABILITY_WEIGHT = 0.3  # share of a new attempt in the per-subject ability estimate
+
+# Adaptive question selection (get-questions/?adaptive=true)
+ADAPTIVE_QUESTION_COUNT = 5  # questions returned per request
+ADAPTIVE_TABLE_TTL = 300  # seconds before a worker reloads a quiz's calibration table
+
+# Recommendation engines, see quiz_app.recommendation.ENGINES for the registered versions
+RECOMMENDATION_ENGINE = 'tfidf-cf-1'  # engine whose results are saved and served
+RECOMMENDATION_SHADOW_ENGINE = None  # candidate ranked alongside it and only logged, e.g. 'tfidf-cf-2'
+RECOMMENDATION_SHADOW_SAMPLE_RATE = 0.1  # share of graded attempts shadowed
+RECOMMENDATION_SHADOW_WORKERS = 2  # background threads per process running shadow rankings
+
+# Out-of-process scoring (`manage.py run_scoring_service`). Unset, every web
+# process ranks in-process; otherwise 'unix:/path/to/scoring.sock' or '127.0.0.1:8765'
+RECOMMENDATION_SERVICE_ADDRESS = None
+RECOMMENDATION_SERVICE_WORKERS = 4  # pre-forked scoring processes
+RECOMMENDATION_SERVICE_MAX_BATCH = 32  # rank calls sent per round trip
+RECOMMENDATION_SERVICE_MAX_WAIT_MS = 2  # how long a batch waits to fill up
+RECOMMENDATION_SERVICE_CONNECTIONS = 4  # concurrent batches in flight per web process
+RECOMMENDATION_SERVICE_TIMEOUT = 10  # seconds before falling back to in-process ranking
+
+QUIZ_PASS_SCORE = 50  # percentage counted as a pass in the analytics rollups